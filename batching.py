@@ -0,0 +1,59 @@
+import math
+import re
+
+import numpy as np
+
+# BERT inputs are truncated at 512 tokens, including [CLS] and [SEP]
+MAX_TOKENS = 512
+TOKEN_BUDGET = 16384
+MAX_BATCH_SIZE = 256
+
+# marks a text the model could not score, so callers can tell it from a real 0.0
+FAILED = math.nan
+
+# BERT's basic tokenizer splits on whitespace and punctuation; wordpieces only add to this
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text):
+    return min(MAX_TOKENS, 2 + len(TOKEN_PATTERN.findall(text)))
+
+def token_batches(lengths, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    # texts sorted by length, each batch capped by its padded size (rows x longest row)
+    batches, batch, longest = [], [], 0
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        padded = max(longest, lengths[i]) * (len(batch) + 1)
+        if batch and (padded > token_budget or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(i)
+        longest = max(longest, lengths[i])
+    if batch:
+        batches.append(batch)
+    return batches
+
+def predict_batch(predict, texts):
+    try:
+        scores = predict(texts)
+        if isinstance(scores, (list, np.ndarray)):
+            return [float(score) for score in scores]
+        return [float(scores)] * len(texts)
+    except Exception:
+        # batch processing failed, process one by one
+        scores = []
+        for text in texts:
+            try:
+                score = predict([text])
+                scores.append(float(score[0]) if isinstance(score, (list, np.ndarray)) else float(score))
+            except Exception:
+                scores.append(FAILED)
+        return scores
+
+def score_in_batches(predict, texts, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE, progress=None):
+    # scores come back in the order of texts, whatever order the batches ran in
+    scores = [0.0] * len(texts)
+    for batch in token_batches([estimate_tokens(text) for text in texts], token_budget, max_batch_size):
+        for i, score in zip(batch, predict_batch(predict, [texts[i] for i in batch])):
+            scores[i] = score
+        if progress is not None:
+            progress.update(len(batch))
+    return scores
@@ -0,0 +1,182 @@
+import os
+import gzip
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import time
+
+import duckdb
+import numpy as np
+
+from batching import estimate_tokens, score_in_batches
+from transform import COMMENT_TYPES, RAW_COMMENTS, raw_source
+from verify import verify_files
+
+def synthetic_events(n_events, seed=0):
+    rng = random.Random(seed)
+    event_types = ["PushEvent", "IssueCommentEvent", "PullRequestReviewCommentEvent",
+                   "WatchEvent", "CreateEvent", "PullRequestReviewEvent"]
+    for i in range(n_events):
+        event_type = rng.choice(event_types)
+        payload = {"action": "created", "size": rng.randint(1, 20),
+                   "commits": [{"sha": f"{rng.getrandbits(160):040x}", "message": "x" * rng.randint(10, 200)}]}
+        body = " ".join(rng.choice(["lgtm", "fix", "please", "thanks", "bug"]) for _ in range(rng.randint(1, 80)))
+        user = {"login": f"user{rng.randint(0, 5000)}", "id": i}
+        if event_type.endswith("CommentEvent"):
+            payload["comment"] = {"id": i, "html_url": f"https://github.com/o/r/issues/1#issuecomment-{i}",
+                                  "body": body, "user": user, "created_at": "2019-01-01T00:00:00Z"}
+        if event_type == "IssueCommentEvent":
+            payload["issue"] = {"id": rng.randint(0, 10**9), "number": 1, "title": "t", "labels": []}
+        elif event_type.startswith("PullRequestReview"):
+            payload["pull_request"] = {"id": rng.randint(0, 10**9), "number": 1, "title": "t", "labels": []}
+        if event_type == "PullRequestReviewEvent":
+            payload["review"] = {"id": i, "html_url": f"https://github.com/o/r/pull/1#pullrequestreview-{i}",
+                                 "body": body, "user": user, "submitted_at": "2019-01-01T00:00:00Z"}
+        yield json.dumps({"id": str(10**10 + i), "type": event_type,
+                          "actor": {"id": i, "login": f"user{i % 5000}"},
+                          "repo": {"id": i % 1000, "name": f"org{i % 100}/repo{i % 1000}"},
+                          "public": True, "created_at": "2019-01-01T00:00:00Z", "payload": payload})
+
+def write_synthetic_archive(filename, size_mb, seed=0):
+    target = size_mb * 1024 * 1024
+    written = 0
+    with gzip.open(filename, 'wt') as f:
+        for line in synthetic_events(10**9, seed):
+            f.write(line + "\n")
+            written += len(line) + 1
+            if written >= target:
+                break
+    return filename
+
+def bench_gzip(args):
+    workers = args.workers or os.cpu_count()
+    tmp_dir = tempfile.mkdtemp(prefix="bench_gzip_")
+    try:
+        source = write_synthetic_archive(os.path.join(tmp_dir, "source.json.gz"), args.size_mb)
+        files = []
+        for i in range(args.files or workers * 2):
+            copy = os.path.join(tmp_dir, f"hour-{i}.json.gz")
+            shutil.copyfile(source, copy)
+            files.append(copy)
+        compressed = sum(os.path.getsize(f) for f in files)
+
+        print(f"{len(files)} files, {compressed / 1024**2:.1f} MB compressed in total")
+        for n in sorted({1, workers}):
+            started = time.perf_counter()
+            results = list(verify_files(files, n))
+            elapsed = time.perf_counter() - started
+            uncompressed = sum(r[3] for r in results)
+            assert all(r[1] for r in results)
+            print(f"workers={n}: {compressed / elapsed / 1024**3:.3f} GB/s compressed, "
+                  f"{uncompressed / elapsed / 1024**3:.3f} GB/s uncompressed, "
+                  f"{compressed / elapsed / 1024**3 / n:.3f} GB/s compressed per core")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def bench_parse(args):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_parse_")
+    try:
+        for i in range(args.files):
+            write_synthetic_archive(os.path.join(tmp_dir, f"2019-01-01-{i}.json.gz"), args.size_mb, seed=i)
+        pattern = os.path.join(tmp_dir, "*.json.gz")
+        compressed = sum(os.path.getsize(os.path.join(tmp_dir, f)) for f in os.listdir(tmp_dir))
+        uncompressed = args.files * args.size_mb * 1024**2
+
+        print(f"{args.files} files, {compressed / 1024**2:.1f} MB compressed, {uncompressed / 1024**2:.0f} MB of JSON")
+        con = duckdb.connect()
+        if args.threads:
+            con.execute(f"SET threads = {args.threads}")
+        for label, declared in (("read_ndjson_auto", False), ("declared schema", True)):
+            query = RAW_COMMENTS.format(raw_source=raw_source(pattern, declared), comment_types=COMMENT_TYPES)
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                rows, chars = con.execute(f"SELECT COUNT(*), SUM(LENGTH(text)) FROM ({query})").fetchone()
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            print(f"{label}: {rows} comments ({chars} chars) in {best:.2f}s, "
+                  f"{uncompressed / best / 1024**2:.1f} MB/s of JSON")
+        con.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def synthetic_comments(n, seed=0):
+    # mostly short review chatter with a long tail of pasted logs and stack traces
+    rng = random.Random(seed)
+    words = ["lgtm", "thanks", "fix", "please", "rebase", "test", "fails", "on", "ci", "the", "this", "merge"]
+    texts = []
+    for _ in range(n):
+        if rng.random() < 0.03:
+            texts.append("\n".join(f'  File "src/module_{rng.randint(0, 99)}.py", line {rng.randint(1, 999)}, in run'
+                                   for _ in range(rng.randint(20, 60))))
+        else:
+            texts.append(" ".join(rng.choice(words) for _ in range(max(1, int(rng.lognormvariate(2.3, 1.0))))))
+    return texts
+
+class PaddedCostModel:
+    # stands in for BERT: work grows with rows x padded length (and its square, for attention)
+    def __init__(self, hidden=64):
+        self.weights = np.random.default_rng(0).standard_normal((hidden, hidden)).astype(np.float32)
+        self.hidden = hidden
+        self.padded_tokens = 0
+
+    def __call__(self, texts):
+        length = max(estimate_tokens(text) for text in texts)
+        self.padded_tokens += length * len(texts)
+        x = np.ones((len(texts), length, self.hidden), dtype=np.float32)
+        x = x @ self.weights
+        attention = x @ x.transpose(0, 2, 1)
+        return list(attention.mean(axis=(1, 2)) * 0.0)
+
+def fixed_batches(predict, texts, batch_size=100):
+    scores = []
+    for i in range(0, len(texts), batch_size):
+        scores.extend(predict(texts[i:i + batch_size]))
+    return scores
+
+def bench_batching(args):
+    texts = synthetic_comments(args.texts)
+    real_tokens = sum(estimate_tokens(text) for text in texts)
+    print(f"{len(texts)} texts, {real_tokens} tokens, "
+          f"longest {max(estimate_tokens(text) for text in texts)}, median {sorted(map(estimate_tokens, texts))[len(texts) // 2]}")
+    runs = [
+        ("fixed batches of 100", lambda predict: fixed_batches(predict, texts)),
+        (f"token budget {args.token_budget}",
+         lambda predict: score_in_batches(predict, texts, args.token_budget, args.max_batch_size)),
+    ]
+    for label, run in runs:
+        model = PaddedCostModel()
+        started = time.perf_counter()
+        scores = run(model)
+        elapsed = time.perf_counter() - started
+        assert len(scores) == len(texts)
+        print(f"{label}: {len(texts) / elapsed:.0f} texts/s, {model.padded_tokens} padded tokens "
+              f"({model.padded_tokens / real_tokens:.2f}x real)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the ingestion and scoring pipeline")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    gzip_parser = subparsers.add_parser("gzip", help="full CRC gzip verification throughput")
+    gzip_parser.add_argument("--size-mb", type=int, default=64, help="uncompressed size of each synthetic hour file")
+    gzip_parser.add_argument("--files", type=int, default=None)
+    gzip_parser.add_argument("--workers", type=int, default=None)
+    gzip_parser.set_defaults(func=bench_gzip)
+
+    parse_parser = subparsers.add_parser("parse", help="comment extraction throughput, inferred vs declared JSON schema")
+    parse_parser.add_argument("--size-mb", type=int, default=64, help="uncompressed size of each synthetic hour file")
+    parse_parser.add_argument("--files", type=int, default=4)
+    parse_parser.add_argument("--threads", type=int, default=None)
+    parse_parser.add_argument("--repeat", type=int, default=3, help="best of this many runs is reported")
+    parse_parser.set_defaults(func=bench_parse)
+
+    batching_parser = subparsers.add_parser("batching", help="fixed-size vs token-budget batching on a padded cost model")
+    batching_parser.add_argument("--texts", type=int, default=20000)
+    batching_parser.add_argument("--token-budget", type=int, default=16384)
+    batching_parser.add_argument("--max-batch-size", type=int, default=256)
+    batching_parser.set_defaults(func=bench_batching)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,8 +1,38 @@
 import os
+import argparse
 import requests
 import gzip
+import hashlib
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+import urllib3
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import IngestMetrics
+from manifest import COMPLETE_STATUSES, DownloadManifest, hour_key, utc_now
+from rate_limit import RETRYABLE_STATUSES, RateLimiter, parse_retry_after
+from verify import verify_files, verify_gzip_stream
+
+GHARCHIVE_URL = "https://data.gharchive.org"
+
+COMMENT_EVENT_TYPES = ("IssueCommentEvent", "PullRequestReviewCommentEvent", "PullRequestReviewEvent")
+
+# columns produced by the filtered_comments view in duckDB.sql
+COMMENT_SCHEMA = pa.schema([
+    ("repo", pa.string()),
+    ("event_id", pa.string()),
+    ("event_type", pa.string()),
+    ("comment_id", pa.int64()),
+    ("comment_url", pa.string()),
+    ("issue_or_pr_id", pa.int64()),
+    ("user_login", pa.string()),
+    ("created_at", pa.timestamp("s", tz="UTC")),
+    ("text", pa.string()),
+])
 
 def check_gzip_integrity(filename):
     try:
@@ -27,101 +57,503 @@ def check_gzip_integrity(filename):
         print(f"File integrity check failed for {filename}: {e}")
         return False
 
-def download_with_retry(url, filename, max_retries=3):
+def file_checksum(filename, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_session(pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def expected_length(response, offset):
+    # Content-Range: bytes 1000-4999/5000 on a resumed transfer, Content-Length otherwise
+    content_range = response.headers.get("Content-Range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    content_length = response.headers.get("Content-Length")
+    return offset + int(content_length) if content_length and content_length.isdigit() else None
+
+def wait_before_retry(limiter, attempt, max_retries, error=None):
+    status = retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        status = response.status_code
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    delay = limiter.on_failure(attempt, status, retry_after)
+    if attempt < max_retries - 1:
+        print(f"Retrying in {delay:.1f} seconds...")
+        time.sleep(delay)
+
+def is_retryable(error):
+    response = getattr(error, "response", None)
+    return response is None or response.status_code in RETRYABLE_STATUSES
+
+def new_stats():
+    return {"bytes": 0, "retries": 0, "ttfb": None, "download_seconds": 0.0, "verify_seconds": 0.0}
+
+def download_with_retry(url, filename, max_retries=3, session=None, limiter=None, stats=None):
+    http = session or requests
+    limiter = limiter or RateLimiter()
+    stats = stats if stats is not None else new_stats()
+    # bytes already received survive a failed attempt and are resumed with a Range request
+    part_filename = filename + ".part"
+    validator = None
+    resumed = False
+
     for attempt in range(max_retries):
+        stats["retries"] = attempt
         try:
-            print(f"Downloading {os.path.basename(filename)} (attempt {attempt + 1}/{max_retries})")
-            response = requests.get(url, stream=True, timeout=60)
+            offset = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+            headers = {}
+            if offset:
+                # hour files are immutable, so a part left by an earlier run is resumed too;
+                # the stitched result is CRC-checked either way
+                headers["Range"] = f"bytes={offset}-"
+                if validator:
+                    headers["If-Range"] = validator
+                print(f"Resuming {os.path.basename(filename)} at byte {offset} (attempt {attempt + 1}/{max_retries})")
+            elif attempt:
+                print(f"Downloading {os.path.basename(filename)} (attempt {attempt + 1}/{max_retries})")
+
+            limiter.acquire()
+            started = time.time()
+            response = http.get(url, stream=True, timeout=60, headers=headers)
+            if offset and response.status_code == 416:
+                # nothing left to fetch, the part may already hold the whole file
+                response.close()
+                if verify_gzip_stream(part_filename)[0]:
+                    os.replace(part_filename, filename)
+                    return True
+                os.remove(part_filename)
+                continue
             response.raise_for_status()
+            limiter.on_success()
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified") or validator
+
+            if offset and response.status_code != 206:
+                # server ignored the range or the file changed upstream, start over
+                offset = 0
+            resumed = resumed or offset > 0
+            total = expected_length(response, offset)
 
-            with open(filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            stats["ttfb"] = response.elapsed.total_seconds()
+            try:
+                with open(part_filename, 'ab' if offset else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
+                            stats["bytes"] += len(chunk)
+            finally:
+                stats["download_seconds"] += time.time() - started
 
-            if check_gzip_integrity(filename):
-                print(f"Downloaded and verified {filename}")
+            size = os.path.getsize(part_filename)
+            if total is not None and size != total:
+                print(f"Transfer of {os.path.basename(filename)} stopped at {size}/{total} bytes, retrying...")
+                if size > total:
+                    os.remove(part_filename)
+                continue
+
+            # a stitched file gets the full CRC check, a single transfer the cheap header check
+            started = time.time()
+            ok = verify_gzip_stream(part_filename)[0] if resumed else check_gzip_integrity(part_filename)
+            stats["verify_seconds"] += time.time() - started
+            if ok:
+                os.replace(part_filename, filename)
                 return True
             else:
                 print(f"Downloaded file {filename} failed integrity check, retrying...")
-                if os.path.exists(filename):
-                    os.remove(filename)
+                if os.path.exists(part_filename):
+                    os.remove(part_filename)
+                resumed = False
                 continue
-                
+
         except requests.exceptions.ReadTimeout:
             print(f"Read timeout on attempt {attempt + 1} for {url}")
-            if os.path.exists(filename):
-                os.remove(filename)
-            if attempt < max_retries - 1:
-                print(f"Retrying in 2 seconds...")
-                time.sleep(2)
+            wait_before_retry(limiter, attempt, max_retries)
             continue
         except requests.exceptions.RequestException as e:
             print(f"Request failed for {url}: {e}")
-            if os.path.exists(filename):
-                os.remove(filename)
-            if attempt < max_retries - 1:
-                print(f"Retrying in 2 seconds...")
-                time.sleep(2)
+            if not is_retryable(e):
+                break
+            wait_before_retry(limiter, attempt, max_retries, e)
             continue
         except Exception as e:
             print(f"Error saving {url}: {e}")
-            if os.path.exists(filename):
-                os.remove(filename)
+            if os.path.exists(part_filename):
+                os.remove(part_filename)
             break
-    
+
+    return False
+
+def parse_timestamp(value):
+    if value is None:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def project_comment_event(event):
+    event_type = event.get("type")
+    if event_type not in COMMENT_EVENT_TYPES:
+        return None
+
+    # same per-type projection as RAW_COMMENTS in transform.py: review comments hang off
+    # payload.pull_request, review bodies live in payload.review
+    payload = event.get("payload") or {}
+    is_review = event_type == "PullRequestReviewEvent"
+    comment = payload.get("review" if is_review else "comment")
+    parent = payload.get("issue" if event_type == "IssueCommentEvent" else "pull_request")
+    if not comment or comment.get("body") is None:
+        return None
+    text = comment["body"].strip()
+    if not text or parent is None:
+        return None
+
+    return {
+        "repo": (event.get("repo") or {}).get("name"),
+        "event_id": event.get("id"),
+        "event_type": event_type,
+        "comment_id": comment.get("id"),
+        "comment_url": comment.get("html_url"),
+        "issue_or_pr_id": parent.get("id"),
+        "user_login": (comment.get("user") or {}).get("login"),
+        "created_at": parse_timestamp(comment.get("submitted_at" if is_review else "created_at")),
+        "text": text,
+    }
+
+def filter_comment_stream(stream):
+    rows = []
+    with gzip.GzipFile(fileobj=stream) as events:
+        for line in events:
+            # cheap byte test so non-comment events are never parsed
+            if b'CommentEvent"' not in line and b'ReviewEvent"' not in line:
+                continue
+            row = project_comment_event(json.loads(line))
+            if row is not None:
+                rows.append(row)
+    return rows
+
+def write_comment_parquet(rows, filename):
+    table = pa.Table.from_pylist(rows, schema=COMMENT_SCHEMA)
+    tmp_filename = filename + ".tmp"
+    pq.write_table(table, tmp_filename, compression="zstd")
+    os.replace(tmp_filename, filename)
+
+def download_filtered_with_retry(url, filename, max_retries=3, session=None, limiter=None, stats=None):
+    http = session or requests
+    limiter = limiter or RateLimiter()
+    stats = stats if stats is not None else new_stats()
+    for attempt in range(max_retries):
+        stats["retries"] = attempt
+        try:
+            if attempt:
+                print(f"Filtering {os.path.basename(url)} (attempt {attempt + 1}/{max_retries})")
+            limiter.acquire()
+            started = time.time()
+            response = http.get(url, stream=True, timeout=60)
+            response.raise_for_status()
+            limiter.on_success()
+            stats["ttfb"] = response.elapsed.total_seconds()
+
+            try:
+                rows = filter_comment_stream(response.raw)
+            finally:
+                stats["bytes"] += response.raw.tell()
+                stats["download_seconds"] += time.time() - started
+            write_comment_parquet(rows, filename)
+            stats["rows"] = len(rows)
+            return True
+
+        # the body is decompressed straight off response.raw, so a dropped connection surfaces
+        # as a urllib3 error rather than a requests one
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, OSError, EOFError, ValueError) as e:
+            print(f"Filtering failed for {url}: {e}")
+            if not is_retryable(e):
+                break
+            wait_before_retry(limiter, attempt, max_retries, e)
+            continue
+
     return False
 
-def download_gharchive_data(year = 2020, base_save_dir="/home/strrl/ssd/gh_data"):
+def hour_name(hour):
+    return f"{hour.strftime('%Y-%m')}-{hour.day:02d}-{hour.hour}.json.gz"
+
+def iter_hours(year, save_dir):
+    current = datetime(year, 1, 1)
+    end_date = datetime(year+1, 1, 1)
+
+    while current < end_date:
+        name = hour_name(current)
+        yield f"{GHARCHIVE_URL}/{name}", os.path.join(save_dir, name)
+        current += timedelta(hours=1)
+
+def iter_hour_range(start, end, base_save_dir):
+    current = start.replace(minute=0, second=0, microsecond=0)
+
+    while current < end:
+        name = hour_name(current)
+        yield f"{GHARCHIVE_URL}/{name}", os.path.join(base_save_dir, str(current.year), name)
+        current += timedelta(hours=1)
+
+def download_hour(url, filename, session=None, limiter=None):
+    name = os.path.basename(filename)
+    stats = new_stats()
+
+    if os.path.exists(filename):
+        if check_gzip_integrity(filename):
+            return "existed", filename, stats
+        print(f"File exists but incomplete, re-downloading: {name}")
+        os.remove(filename)
+
+    if download_with_retry(url, filename, session=session, limiter=limiter, stats=stats):
+        return "downloaded", filename, stats
+    return "failed", filename, stats
+
+def filter_hour(url, filename, session=None, limiter=None):
+    # raw .json.gz is never written, only the projected comment rows
+    filename = filename.replace(".json.gz", ".parquet")
+
+    stats = new_stats()
+
+    if os.path.exists(filename):
+        return "existed", filename, stats
+
+    if download_filtered_with_retry(url, filename, session=session, limiter=limiter, stats=stats):
+        return "downloaded", filename, stats
+    return "failed", filename, stats
+
+def manifest_path(base_save_dir, filtered=False):
+    return os.path.join(base_save_dir, "filtered_manifest.sqlite" if filtered else "manifest.sqlite")
+
+def download_hours(hours, manifest, workers=1, session=None, limiter=None, filtered=False, metrics=None):
+    metrics = metrics or IngestMetrics()
+    metrics.total = len(hours)
+    session = session or make_session(workers)
+    # one limiter for all workers so throttling by the origin slows the whole pool
+    limiter = limiter or RateLimiter()
+    hour_task = filter_hour if filtered else download_hour
+    new_files = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_hour, hour_task, url, filename, session, limiter): (url, filename)
+                   for url, filename in hours}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # one broken hour is recorded as failed, it does not end the run
+                url, filename = futures[future]
+                print(f"Error fetching {url}: {e}")
+                record = {"hour": hour_key(url), "url": url, "path": filename, "status": "failed",
+                          "size": None, "checksum": None, **new_stats()}
+            status, path = record["status"], record["path"]
+            manifest.record(record["url"], path, "failed" if status == "failed" else "downloaded",
+                            size=record["size"], checksum=record["checksum"])
+            metrics.record("download", **record)
+            if status != "failed":
+                new_files.append(path)
+
+    return metrics, sorted(new_files)
+
+def run_hour(hour_task, url, filename, session, limiter):
+    status, path, stats = hour_task(url, filename, session, limiter)
+    size = checksum = None
+    if status != "failed":
+        size, checksum = os.path.getsize(path), file_checksum(path)
+    return {"hour": hour_key(url), "url": url, "path": path, "status": status,
+            "size": size, "checksum": checksum, **stats}
+
+def download_gharchive_data(year = 2020, base_save_dir="/home/strrl/ssd/gh_data", workers=1, session=None,
+                            filtered=False, manifest=None, limiter=None, metrics_dir=None):
     save_dir = os.path.join(base_save_dir, str(year))
     os.makedirs(save_dir, exist_ok=True)
+    manifest = manifest or DownloadManifest(manifest_path(base_save_dir, filtered))
 
-    start_date = datetime(year, 1, 1)
-    end_date = datetime(year+1, 1, 1)
+    # resume from the manifest instead of probing every hour file on disk
+    completed = manifest.completed_hours(year)
+    hours = [(url, filename) for url, filename in iter_hours(year, save_dir) if hour_key(url) not in completed]
 
-    current = start_date
-    total_files = 0
-    downloaded_files = 0
+    print(f"Start downloading {year} data to: {save_dir} ({workers} workers, "
+          f"{len(completed)} hours already complete)")
 
-    print(f"Start downloading {year} data to: {save_dir}")
+    metrics = IngestMetrics(metrics_dir, run_name=f"download-{year}")
+    download_hours(hours, manifest, workers, session, limiter, filtered, metrics)
 
-    while current < end_date:
-        month = current.strftime("%Y-%m")
-        day = current.day
-        hour = current.hour
+    metrics.summary(f"{year} download ({len(completed)} hours already complete)")
+    return metrics.counts
 
-        url = f"https://data.gharchive.org/{month}-{day:02d}-{hour}.json.gz"
-        filename = os.path.join(save_dir, f"{month}-{day:02d}-{hour}.json.gz")
+def sync_gharchive_data(start=None, end=None, base_save_dir="/home/strrl/ssd/gh_data", workers=1,
+                        filtered=False, manifest=None, limiter=None, lookback_hours=24, metrics_dir=None):
+    manifest = manifest or DownloadManifest(manifest_path(base_save_dir, filtered))
+    if start is None:
+        last_sync = manifest.last_sync()
+        if last_sync is None:
+            raise ValueError("no previous sync recorded, pass an explicit start")
+        # re-check a short window so hours published late or failed last time are picked up
+        start = datetime.fromisoformat(last_sync["range_end"]) - timedelta(hours=lookback_hours)
+    if end is None:
+        end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
 
-        total_files += 1
+    completed = set()
+    for year in range(start.year, end.year + 1):
+        completed |= manifest.completed_hours(year)
+        os.makedirs(os.path.join(base_save_dir, str(year)), exist_ok=True)
 
-        if os.path.exists(filename):
-            if check_gzip_integrity(filename):
-                print(f"File already exists and is complete: {month}-{day:02d}-{hour}.json.gz")
-            else:
-                print(f"File exists but incomplete, re-downloading: {month}-{day:02d}-{hour}.json.gz")
-                os.remove(filename)
-                if download_with_retry(url, filename):
-                    downloaded_files += 1
+    hours = [(url, filename) for url, filename in iter_hour_range(start, end, base_save_dir)
+             if hour_key(url) not in completed]
+
+    print(f"Syncing {start:%Y-%m-%d %H}:00 to {end:%Y-%m-%d %H}:00: {len(hours)} missing hours")
+
+    metrics = IngestMetrics(metrics_dir, run_name="sync")
+    _, new_files = download_hours(hours, manifest, workers, limiter=limiter, filtered=filtered, metrics=metrics)
+    manifest.record_sync(start.isoformat(), end.isoformat(), len(new_files), metrics.counts["failed"])
+
+    metrics.summary(f"Sync ({len(new_files)} new files)")
+    return new_files
+
+def reconcile_manifest(year, base_save_dir="/home/strrl/ssd/gh_data", filtered=False, manifest=None):
+    save_dir = os.path.join(base_save_dir, str(year))
+    manifest = manifest or DownloadManifest(manifest_path(base_save_dir, filtered))
+    known = {entry["hour"]: entry for entry in manifest.entries(year)}
+    # raw files of ingested hours may have been deleted on purpose by pipeline.py
+    ingested = manifest.ingested_hours(year)
+    counts = {"recorded": 0, "unchanged": 0, "removed": 0}
+
+    print(f"Reconciling {year} manifest against {save_dir}")
+
+    for url, filename in iter_hours(year, save_dir):
+        if filtered:
+            filename = filename.replace(".json.gz", ".parquet")
+        entry = known.get(hour_key(url))
+
+        if not os.path.exists(filename) or (not filtered and not check_gzip_integrity(filename)):
+            if entry is not None and entry["status"] != "failed" and entry["hour"] not in ingested:
+                manifest.forget(url)
+                counts["removed"] += 1
+            continue
+
+        size = os.path.getsize(filename)
+        if entry is not None and entry["status"] in COMPLETE_STATUSES and entry["size"] == size:
+            counts["unchanged"] += 1
+            continue
+
+        manifest.record(url, filename, "downloaded", size=size, checksum=file_checksum(filename))
+        counts["recorded"] += 1
+
+    print(f"Recorded: {counts['recorded']}, unchanged: {counts['unchanged']}, removed: {counts['removed']}")
+    return counts
+
+def verify_gharchive_data(year, base_save_dir="/home/strrl/ssd/gh_data", workers=None, manifest=None,
+                          metrics_dir=None):
+    manifest = manifest or DownloadManifest(manifest_path(base_save_dir))
+    metrics = IngestMetrics(metrics_dir, run_name=f"verify-{year}")
+    # files already verified are cached in the manifest and never reread
+    entries = {entry["path"]: entry for entry in manifest.unverified(year)}
+    counts = {"verified": 0, "corrupt": 0}
+    verified_bytes = 0
+    started = time.time()
+
+    print(f"Verifying {len(entries)} unverified {year} files (CRC32 + ISIZE)")
+
+    for filename, ok, error, uncompressed, seconds in verify_files(list(entries), workers):
+        entry = entries[filename]
+        metrics.record("verify", "verified" if ok else "corrupt", hour=entry["hour"], path=filename,
+                       size=entry["size"], uncompressed=uncompressed, verify_seconds=seconds, error=error)
+        if ok:
+            manifest.record(entry["url"], filename, "verified", size=entry["size"],
+                            checksum=entry["checksum"], verified_at=utc_now())
+            counts["verified"] += 1
+            verified_bytes += entry["size"] or 0
         else:
-            if download_with_retry(url, filename):
-                downloaded_files += 1
-        
-        current += timedelta(hours=1)
+            print(f"Verification failed for {filename}: {error}")
+            if os.path.exists(filename):
+                os.remove(filename)
+            manifest.record(entry["url"], filename, "corrupt", verified_at=utc_now())
+            counts["corrupt"] += 1
+
+    elapsed = max(time.time() - started, 1e-6)
+    metrics.flush()
+    print(f"Verified: {counts['verified']}, corrupt (removed): {counts['corrupt']} "
+          f"({verified_bytes / elapsed / 1024**3:.2f} GB/s)")
+    return counts
 
-    print(f"\n{year} year download summary:")
-    print(f"Total files: {total_files}")
-    print(f"Downloaded files: {downloaded_files}")
-    print(f"Already existed: {total_files - downloaded_files}")
+def print_manifest_summary(year, base_save_dir="/home/strrl/ssd/gh_data", filtered=False, manifest=None):
+    manifest = manifest or DownloadManifest(manifest_path(base_save_dir, filtered))
+    summary = manifest.summary(year)
+    total_hours = sum(1 for _ in iter_hours(year, ""))
+    complete = sum(summary.get(status, {}).get("files", 0) for status in COMPLETE_STATUSES)
 
+    print(f"\n{year} manifest summary ({manifest.path}):")
+    for status, stats in sorted(summary.items()):
+        print(f"{status}: {stats['files']} files, {stats['bytes'] / 1024**3:.2f} GB")
+    print(f"missing: {total_hours - complete} of {total_hours} hours")
+    return summary
 
-def download_multiple_years(years, base_save_dir="/home/strrl/ssd/gh_data"):
+
+def download_multiple_years(years, base_save_dir="/home/strrl/ssd/gh_data", workers=1, filtered=False,
+                            rate=20.0, metrics_dir=None):
+    session = make_session(workers)
+    limiter = RateLimiter(rate)
+    manifest = DownloadManifest(manifest_path(base_save_dir, filtered))
     for year in years:
         print(f"\n{'='*50}")
         print(f"Start processing {year} data")
         print(f"{'='*50}")
-        download_gharchive_data(year, base_save_dir)
+        download_gharchive_data(year, base_save_dir, workers=workers, session=session,
+                                filtered=filtered, manifest=manifest, limiter=limiter, metrics_dir=metrics_dir)
 
 if __name__ == "__main__":
-    years_to_download = [2019, 2020, 2021, 2022, 2023, 2024]
-    download_multiple_years(years_to_download)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download GH Archive hour files")
+    parser.add_argument("years", nargs="*", type=int, default=[2019, 2020, 2021, 2022, 2023, 2024])
+    parser.add_argument("--base-dir", default="/home/strrl/ssd/gh_data")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="number of hour files downloaded concurrently")
+    parser.add_argument("--rate", type=float, default=20.0,
+                        help="maximum requests per second shared by all workers")
+    parser.add_argument("--filter", action="store_true",
+                        help="keep only comment events, written as one Parquet file per hour")
+    parser.add_argument("--summary", action="store_true",
+                        help="print per-year status from the manifest without touching the data files")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="rescan the data directory and bring the manifest in line with it")
+    parser.add_argument("--verify", action="store_true",
+                        help="fully decompress unverified files and check their CRC32/ISIZE trailers")
+    parser.add_argument("--verify-workers", type=int, default=None,
+                        help="processes used by --verify (default: all cores)")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                        help="sync mode: first hour to fetch, e.g. 2024-03-01 or 2024-03-01T05")
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None,
+                        help="sync mode: end of the range, exclusive (default: the current hour)")
+    parser.add_argument("--since-last-sync", action="store_true",
+                        help="sync mode: continue from the end of the previous sync")
+    parser.add_argument("--new-files", default=None,
+                        help="sync mode: write the paths of newly fetched files here, one per line")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="per-file JSON lines and Prometheus snapshot output (default: <base-dir>/metrics)")
+    args = parser.parse_args()
+    metrics_dir = args.metrics_dir or os.path.join(args.base_dir, "metrics")
+
+    if args.since or args.since_last_sync:
+        new_files = sync_gharchive_data(args.since, args.until, args.base_dir, workers=args.workers,
+                                        filtered=args.filter, limiter=RateLimiter(args.rate),
+                                        metrics_dir=metrics_dir)
+        if args.new_files:
+            with open(args.new_files, 'w') as f:
+                f.writelines(path + "\n" for path in new_files)
+    elif args.summary or args.reconcile or args.verify:
+        manifest = DownloadManifest(manifest_path(args.base_dir, args.filter))
+        for year in args.years:
+            if args.reconcile:
+                reconcile_manifest(year, args.base_dir, filtered=args.filter, manifest=manifest)
+            if args.verify and not args.filter:
+                verify_gharchive_data(year, args.base_dir, workers=args.verify_workers, manifest=manifest,
+                                      metrics_dir=metrics_dir)
+            print_manifest_summary(year, args.base_dir, filtered=args.filter, manifest=manifest)
+    else:
+        download_multiple_years(args.years, args.base_dir, workers=args.workers, filtered=args.filter,
+                                rate=args.rate, metrics_dir=metrics_dir)
@@ -1,21 +1,23 @@
 CREATE OR REPLACE VIEW filtered_comments AS
-SELECT
-  repo.name AS repo,
-  id AS event_id,
-  type AS event_type,
-  payload.comment.id AS comment_id,
-  payload.comment.html_url AS comment_url,
-  payload.issue.id AS issue_or_pr_id,
-  payload.comment.user.login AS user_login,
-  payload.comment.created_at AS created_at,
-  TRIM(payload.comment.body) AS text
-FROM read_ndjson_auto('/gh_data/2019/2019-*.json.gz')
+SELECT * FROM (
+  SELECT
+    repo_name AS repo,
+    event_id,
+    event_type,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_id ELSE comment_id END AS comment_id,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_url ELSE comment_url END AS comment_url,
+    CASE WHEN event_type = 'IssueCommentEvent' THEN issue_id ELSE pull_request_id END AS issue_or_pr_id,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_user_login ELSE comment_user_login END AS user_login,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_submitted_at ELSE comment_created_at END AS created_at,
+    TRIM(CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_body ELSE comment_body END) AS text
+  FROM read_parquet('/gh_landing/year=2019/*/*/*/*.parquet', hive_partitioning = true)
+  WHERE event_type IN ('IssueCommentEvent', 'PullRequestReviewCommentEvent', 'PullRequestReviewEvent')
+)
 WHERE
-  type IN ('IssueCommentEvent', 'PullRequestReviewCommentEvent')
-  AND payload.comment IS NOT NULL
-  AND payload.comment.body IS NOT NULL
-  AND LENGTH(TRIM(payload.comment.body)) > 0
-  AND payload.issue IS NOT NULL
+  comment_id IS NOT NULL
+  AND text IS NOT NULL
+  AND LENGTH(text) > 0
+  AND issue_or_pr_id IS NOT NULL
 
 
 CREATE OR REPLACE VIEW filtered_comments_no_bot AS
@@ -0,0 +1,160 @@
+import os
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import duckdb
+
+from manifest import COMPLETE_STATUSES, DownloadManifest, utc_now
+from verify import verify_gzip_stream
+
+# fixed schema for GH Archive events; only these paths are materialized from the JSON
+USER_STRUCT = 'STRUCT(login VARCHAR)'
+EVENT_COLUMNS = {
+    "id": "VARCHAR",
+    "type": "VARCHAR",
+    "created_at": "TIMESTAMP",
+    "actor": USER_STRUCT,
+    "repo": "STRUCT(name VARCHAR)",
+    "payload": (
+        "STRUCT("
+        "action VARCHAR, "
+        f'comment STRUCT(id BIGINT, html_url VARCHAR, body VARCHAR, "user" {USER_STRUCT}, created_at TIMESTAMP), '
+        "issue STRUCT(id BIGINT), "
+        "pull_request STRUCT(id BIGINT), "
+        f'review STRUCT(id BIGINT, html_url VARCHAR, body VARCHAR, "user" {USER_STRUCT}, submitted_at TIMESTAMP)'
+        ")"
+    ),
+}
+
+LANDING_SELECT = """
+SELECT
+  id AS event_id,
+  created_at,
+  actor.login AS actor_login,
+  repo.name AS repo_name,
+  payload.action AS action,
+  payload.comment.id AS comment_id,
+  payload.comment.html_url AS comment_url,
+  payload.comment.body AS comment_body,
+  payload.comment.user.login AS comment_user_login,
+  payload.comment.created_at AS comment_created_at,
+  payload.issue.id AS issue_id,
+  payload.pull_request.id AS pull_request_id,
+  payload.review.id AS review_id,
+  payload.review.html_url AS review_url,
+  payload.review.body AS review_body,
+  payload.review.user.login AS review_user_login,
+  payload.review.submitted_at AS review_submitted_at,
+  {year} AS year,
+  {month} AS month,
+  {day} AS day,
+  type AS event_type
+FROM read_json(?, format = 'newline_delimited', columns = ?)
+"""
+
+def parse_hour(hour):
+    year, month, day, _ = hour.split("-")
+    return int(year), int(month), int(day)
+
+def transcode_hour(con, hour, source, landing_dir):
+    year, month, day = parse_hour(hour)
+    query = LANDING_SELECT.format(year=year, month=month, day=day)
+    # the file name carries the hour, so re-ingesting an hour overwrites its own files only
+    rows = con.execute(
+        f"""
+        COPY ({query}) TO '{landing_dir}' (
+          FORMAT parquet,
+          COMPRESSION zstd,
+          PARTITION_BY (year, month, day, event_type),
+          OVERWRITE_OR_IGNORE true,
+          FILENAME_PATTERN 'h{hour}_{{i}}'
+        )
+        """,
+        [source, EVENT_COLUMNS],
+    ).fetchone()[0]
+    return rows
+
+def ingest_entry(con, entry, landing_dir):
+    cursor = con.cursor()
+    try:
+        if entry["status"] != "verified":
+            ok, error, _ = verify_gzip_stream(entry["path"])
+            if not ok:
+                return entry, "corrupt", error
+        started = time.time()
+        rows = transcode_hour(cursor, entry["hour"], entry["path"], landing_dir)
+        print(f"Transcoded {entry['hour']}: {rows} events in {time.time() - started:.1f}s")
+        return entry, "ingested", rows
+    except duckdb.Error as e:
+        return entry, "failed", str(e)
+    finally:
+        cursor.close()
+
+def record_ingest_result(manifest, entry, status, detail):
+    if status == "ingested":
+        if entry["status"] != "verified":
+            manifest.record(entry["url"], entry["path"], "verified", size=entry["size"],
+                            checksum=entry["checksum"], verified_at=utc_now())
+        manifest.record_ingest(entry["url"], detail)
+    elif status == "corrupt":
+        print(f"Verification failed for {entry['path']}: {detail}")
+        if os.path.exists(entry["path"]):
+            os.remove(entry["path"])
+        manifest.record(entry["url"], entry["path"], "corrupt", verified_at=utc_now())
+    else:
+        print(f"Transcoding failed for {entry['path']}: {detail}")
+
+def open_landing_connection(threads):
+    con = duckdb.connect()
+    con.execute(f"SET threads = {max(threads, 1)}")
+    return con
+
+def ingest_entries(entries, manifest, landing_dir, workers=4, threads_per_worker=2):
+    os.makedirs(landing_dir, exist_ok=True)
+    con = open_landing_connection(workers * threads_per_worker)
+    counts = {"ingested": 0, "corrupt": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(ingest_entry, con, entry, landing_dir) for entry in entries]
+        for future in as_completed(futures):
+            entry, status, detail = future.result()
+            counts[status] += 1
+            record_ingest_result(manifest, entry, status, detail)
+
+    con.close()
+    return counts
+
+def pending_entries(manifest, year, paths=None):
+    ingested = manifest.ingested_hours(year)
+    entries = [entry for entry in manifest.entries(year, statuses=COMPLETE_STATUSES)
+               if entry["hour"] not in ingested]
+    if paths is not None:
+        entries = [entry for entry in entries if entry["path"] in paths]
+    return entries
+
+def ingest_years(years, base_save_dir="/home/strrl/ssd/gh_data", landing_dir="/home/strrl/ssd/gh_landing",
+                 workers=4, paths=None):
+    manifest = DownloadManifest(os.path.join(base_save_dir, "manifest.sqlite"))
+    for year in years:
+        entries = pending_entries(manifest, year, paths)
+        print(f"\nIngesting {len(entries)} {year} hour files into {landing_dir}")
+        counts = ingest_entries(entries, manifest, landing_dir, workers)
+        print(f"Ingested: {counts['ingested']}, corrupt: {counts['corrupt']}, failed: {counts['failed']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode GH Archive hour files into a Parquet landing zone")
+    parser.add_argument("years", nargs="*", type=int, default=[2019, 2020, 2021, 2022, 2023, 2024])
+    parser.add_argument("--base-dir", default="/home/strrl/ssd/gh_data")
+    parser.add_argument("--landing-dir", default="/home/strrl/ssd/gh_landing")
+    parser.add_argument("--workers", type=int, default=4, help="hour files transcoded concurrently")
+    parser.add_argument("--files-from", default=None,
+                        help="only ingest the paths listed in this file (e.g. download.py --new-files)")
+    args = parser.parse_args()
+
+    paths = None
+    if args.files_from:
+        with open(args.files_from) as f:
+            paths = {line.strip() for line in f if line.strip()}
+
+    ingest_years(args.years, args.base_dir, args.landing_dir, workers=args.workers, paths=paths)
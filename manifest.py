@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+COMPLETE_STATUSES = ("downloaded", "verified")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hours (
+    hour TEXT PRIMARY KEY,
+    year INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    checksum TEXT,
+    status TEXT NOT NULL,
+    verified_at TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hours_year_status ON hours (year, status);
+CREATE TABLE IF NOT EXISTS syncs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    range_start TEXT NOT NULL,
+    range_end TEXT NOT NULL,
+    new_files INTEGER NOT NULL,
+    failed_files INTEGER NOT NULL,
+    finished_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingests (
+    hour TEXT PRIMARY KEY,
+    year INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+"""
+
+def hour_key(url):
+    return os.path.basename(url).replace(".json.gz", "")
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+class DownloadManifest:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def record(self, url, path, status, size=None, checksum=None, verified_at=None):
+        key = hour_key(url)
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO hours (hour, year, url, path, size, checksum, status, verified_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (hour) DO UPDATE SET
+                    url = excluded.url,
+                    path = excluded.path,
+                    size = excluded.size,
+                    checksum = excluded.checksum,
+                    status = excluded.status,
+                    verified_at = excluded.verified_at,
+                    updated_at = excluded.updated_at
+                """,
+                (key, int(key[:4]), url, path, size, checksum, status, verified_at, utc_now()),
+            )
+
+    def forget(self, url):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM hours WHERE hour = ?", (hour_key(url),))
+
+    def completed_hours(self, year):
+        placeholders = ", ".join("?" for _ in COMPLETE_STATUSES)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT hour FROM hours WHERE year = ? AND status IN ({placeholders})",
+                (year, *COMPLETE_STATUSES),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def entries(self, year, statuses=None):
+        query = "SELECT hour, url, path, size, checksum, status, verified_at FROM hours WHERE year = ?"
+        params = [year]
+        if statuses:
+            query += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params.extend(statuses)
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY hour", params).fetchall()
+        keys = ("hour", "url", "path", "size", "checksum", "status", "verified_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def unverified(self, year):
+        return self.entries(year, statuses=("downloaded",))
+
+    def record_sync(self, range_start, range_end, new_files, failed_files):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO syncs (range_start, range_end, new_files, failed_files, finished_at) VALUES (?, ?, ?, ?, ?)",
+                (range_start, range_end, new_files, failed_files, utc_now()),
+            )
+
+    def last_sync(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT range_start, range_end, new_files, failed_files, finished_at FROM syncs ORDER BY range_end DESC LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("range_start", "range_end", "new_files", "failed_files", "finished_at"), row))
+
+    def record_ingest(self, url, rows):
+        key = hour_key(url)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ingests (hour, year, rows, ingested_at) VALUES (?, ?, ?, ?)",
+                (key, int(key[:4]), rows, utc_now()),
+            )
+
+    def ingested_hours(self, year):
+        with self.lock:
+            rows = self.conn.execute("SELECT hour FROM ingests WHERE year = ?", (year,)).fetchall()
+        return {row[0] for row in rows}
+
+    def summary(self, year):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*), COALESCE(SUM(size), 0) FROM hours WHERE year = ? GROUP BY status",
+                (year,),
+            ).fetchall()
+        return {status: {"files": files, "bytes": size} for status, files, size in rows}
@@ -0,0 +1,181 @@
+import os
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class IngestMetrics:
+    def __init__(self, metrics_dir=None, run_name="download", total=None, report_every=24, snapshot_every=30.0):
+        self.total = total
+        self.report_every = report_every
+        self.snapshot_every = snapshot_every
+        self.started = time.time()
+        self.last_snapshot = 0.0
+        self.lock = threading.Lock()
+        self.status_counts = Counter()
+        self.sums = defaultdict(float)
+        self.ttfb = []
+        self.stage_seconds = defaultdict(float)
+        self.jsonl_path = self.prom_path = None
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%dT%H%M%S")
+            self.jsonl_path = os.path.join(metrics_dir, f"{run_name}-{stamp}.jsonl")
+            self.prom_path = os.path.join(metrics_dir, f"{run_name}.prom")
+
+    @property
+    def counts(self):
+        return self.status_counts
+
+    def record(self, stage, status, **fields):
+        record = {"ts": round(time.time(), 3), "stage": stage, "status": status, **fields}
+        with self.lock:
+            if stage == "download":
+                self.status_counts[status] += 1
+            self.sums[f"{stage}_files"] += 1
+            for key in ("bytes", "retries", "rows"):
+                self.sums[f"{stage}_{key}"] += fields.get(key) or 0
+            for key in ("download_seconds", "verify_seconds", "convert_seconds"):
+                self.stage_seconds[key] += fields.get(key) or 0
+            if fields.get("ttfb") is not None:
+                self.ttfb.append(fields["ttfb"])
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(record) + "\n")
+
+            done = sum(self.status_counts.values())
+            if stage == "download" and (done % self.report_every == 0 or done == self.total):
+                self.report(done)
+            if self.prom_path and time.time() - self.last_snapshot >= self.snapshot_every:
+                self.write_snapshot()
+
+    def rates(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        files = sum(self.status_counts.values())
+        return {
+            "elapsed_seconds": elapsed,
+            "bytes_per_second": self.sums["download_bytes"] / elapsed,
+            "transfer_bytes_per_second": self.sums["download_bytes"] / max(self.stage_seconds["download_seconds"], 1e-6),
+            "files_per_hour": files / elapsed * 3600,
+        }
+
+    def report(self, done):
+        rates = self.rates()
+        total = f"/{self.total}" if self.total is not None else ""
+        print(f"[{done}{total}] " + " ".join(f"{k}={v}" for k, v in sorted(self.status_counts.items())) +
+              f" ({rates['bytes_per_second'] / 1024**2:.1f} MB/s, {rates['files_per_hour']:.0f} files/hour)")
+
+    def write_snapshot(self):
+        rates = self.rates()
+        lines = [
+            "# HELP gharchive_files_total Hour files handled by the downloader, by outcome.",
+            "# TYPE gharchive_files_total counter",
+        ]
+        lines += [f'gharchive_files_total{{status="{status}"}} {count}' for status, count in sorted(self.status_counts.items())]
+        lines += [
+            "# HELP gharchive_bytes_total Bytes received from the network.",
+            "# TYPE gharchive_bytes_total counter",
+            f"gharchive_bytes_total {self.sums['download_bytes']:.0f}",
+            "# HELP gharchive_retries_total Download attempts beyond the first.",
+            "# TYPE gharchive_retries_total counter",
+            f"gharchive_retries_total {self.sums['download_retries']:.0f}",
+            "# HELP gharchive_stage_seconds_total Worker time spent per stage.",
+            "# TYPE gharchive_stage_seconds_total counter",
+        ]
+        lines += [f'gharchive_stage_seconds_total{{stage="{key[:-len("_seconds")]}"}} {value:.3f}'
+                  for key, value in sorted(self.stage_seconds.items())]
+        lines += [
+            "# HELP gharchive_ttfb_seconds Time to first byte of successful responses.",
+            "# TYPE gharchive_ttfb_seconds summary",
+            f'gharchive_ttfb_seconds{{quantile="0.5"}} {percentile(self.ttfb, 0.5):.4f}',
+            f'gharchive_ttfb_seconds{{quantile="0.95"}} {percentile(self.ttfb, 0.95):.4f}',
+            f"gharchive_ttfb_seconds_sum {sum(self.ttfb):.4f}",
+            f"gharchive_ttfb_seconds_count {len(self.ttfb)}",
+            "# HELP gharchive_throughput_bytes_per_second Wall-clock network throughput of this run.",
+            "# TYPE gharchive_throughput_bytes_per_second gauge",
+            f"gharchive_throughput_bytes_per_second {rates['bytes_per_second']:.1f}",
+            "# HELP gharchive_files_per_hour Hour files completed per wall-clock hour in this run.",
+            "# TYPE gharchive_files_per_hour gauge",
+            f"gharchive_files_per_hour {rates['files_per_hour']:.1f}",
+        ]
+        tmp_path = self.prom_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prom_path)
+        self.last_snapshot = time.time()
+
+    def flush(self):
+        with self.lock:
+            if self.prom_path:
+                self.write_snapshot()
+
+    def summary(self, title):
+        with self.lock:
+            if self.prom_path:
+                self.write_snapshot()
+            rates = self.rates()
+            files = sum(self.status_counts.values())
+            print(f"\n{title} summary:")
+            print(f"Files: {files} (" + ", ".join(f"{k}: {v}" for k, v in sorted(self.status_counts.items())) + ")")
+            print(f"Received: {self.sums['download_bytes'] / 1024**3:.2f} GB in {rates['elapsed_seconds'] / 60:.1f} min "
+                  f"({rates['bytes_per_second'] / 1024**2:.1f} MB/s wall clock, "
+                  f"{rates['transfer_bytes_per_second'] / 1024**2:.1f} MB/s per stream)")
+            print(f"Files/hour: {rates['files_per_hour']:.0f}")
+            print(f"TTFB: p50 {percentile(self.ttfb, 0.5) * 1000:.0f} ms, p95 {percentile(self.ttfb, 0.95) * 1000:.0f} ms")
+            print(f"Retries: {self.sums['download_retries']:.0f}")
+            print("Worker time: " + ", ".join(f"{key[:-len('_seconds')]} {value:.1f}s"
+                                              for key, value in sorted(self.stage_seconds.items())))
+            if self.jsonl_path:
+                print(f"Per-file metrics: {self.jsonl_path}")
+
+def directory_bytes(path):
+    if path is None or not os.path.exists(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def rows_scanned(node):
+    # JSON scans leave cumulative_rows_scanned near zero, so count what each scan operator produced too
+    if node.get("operator_type") == "TABLE_SCAN":
+        return max(node.get("operator_cardinality", 0), node.get("operator_rows_scanned", 0))
+    return sum(rows_scanned(child) for child in node.get("children", []))
+
+class StageProfile:
+    def __init__(self, profile_dir=None, run_name="transform"):
+        self.run_dir = None
+        if profile_dir:
+            self.run_dir = os.path.join(profile_dir, f"{run_name}-{time.strftime('%Y%m%dT%H%M%S')}")
+            os.makedirs(self.run_dir, exist_ok=True)
+
+    def run(self, con, label, stage, query, output=None):
+        # needs enable_profiling set on the connection; the plan of the last query is read back from it
+        started = time.time()
+        result = con.execute(query).fetchone()
+        seconds = time.time() - started
+        profile = json.loads(con.get_profiling_information(format="json"))
+        record = {
+            "label": label,
+            "stage": stage,
+            "seconds": round(seconds, 3),
+            "rows_scanned": rows_scanned(profile),
+            "rows_emitted": result[0] if result else 0,
+            "bytes_written": directory_bytes(output),
+            "peak_buffer_bytes": profile.get("system_peak_buffer_memory", 0),
+            "peak_temp_bytes": profile.get("system_peak_temp_dir_size", 0),
+        }
+        print(f"[{label} {stage}] scanned {record['rows_scanned']} rows, emitted {record['rows_emitted']} rows, "
+              f"wrote {record['bytes_written'] / 1024**2:.1f} MB in {seconds:.1f}s "
+              f"(peak memory {record['peak_buffer_bytes'] / 1024**3:.2f} GB, spilled {record['peak_temp_bytes'] / 1024**3:.2f} GB)")
+        if self.run_dir:
+            with open(os.path.join(self.run_dir, "stages.jsonl"), 'a') as f:
+                f.write(json.dumps(record) + "\n")
+            with open(os.path.join(self.run_dir, f"{label}-{stage}.txt"), 'w') as f:
+                f.write(con.get_profiling_information(format="query_tree"))
+        return result
@@ -0,0 +1,164 @@
+import os
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from download import download_hour, file_checksum, iter_hours, make_session, manifest_path
+from ingest import ingest_entry, open_landing_connection, record_ingest_result
+from manifest import DownloadManifest, hour_key
+from metrics import IngestMetrics
+from rate_limit import RateLimiter
+
+class StagingBudget:
+    def __init__(self, budget_bytes, initial_estimate=256 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.used = 0
+        self.estimate = initial_estimate
+        self.samples = 0
+        self.condition = threading.Condition()
+
+    def reserve(self):
+        # blocks downloads until conversion has freed enough staging space;
+        # an empty staging area always admits one file, however large
+        with self.condition:
+            size = self.estimate
+            while self.used > 0 and self.used + size > self.budget_bytes:
+                self.condition.wait()
+            self.used += size
+            return size
+
+    def settle(self, reserved, actual):
+        with self.condition:
+            self.used += actual - reserved
+            self.samples += 1
+            # estimate the next file from the largest seen so far, not the mean, to avoid overshoot
+            self.estimate = actual if self.samples == 1 else max(self.estimate, actual)
+            self.condition.notify_all()
+
+    def add(self, size):
+        with self.condition:
+            self.used += size
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+def remove_part(filename):
+    part = filename + ".part"
+    if os.path.exists(part):
+        os.remove(part)
+
+class StagedPipeline:
+    def __init__(self, base_save_dir, landing_dir, budget_bytes, download_workers=8, convert_workers=2,
+                 rate=20.0, metrics_dir=None):
+        self.base_save_dir = base_save_dir
+        self.landing_dir = landing_dir
+        self.budget = StagingBudget(budget_bytes)
+        self.download_workers = download_workers
+        self.convert_workers = convert_workers
+        self.manifest = DownloadManifest(manifest_path(base_save_dir))
+        self.session = make_session(download_workers)
+        self.limiter = RateLimiter(rate)
+        self.con = open_landing_connection(convert_workers * 2)
+        self.metrics_dir = metrics_dir
+        self.metrics = IngestMetrics()
+
+    def fetch(self, url, filename, converter):
+        reserved = self.budget.reserve()
+        status, path, stats = download_hour(url, filename, self.session, self.limiter)
+        if status == "failed":
+            # bytes of a failed transfer are never counted, so they are not kept either
+            remove_part(path)
+            self.budget.release(reserved)
+            self.manifest.record(url, path, "failed")
+            self.metrics.record("download", status, hour=hour_key(url), path=path, **stats)
+            return
+
+        size = os.path.getsize(path)
+        checksum = file_checksum(path)
+        self.budget.settle(reserved, size)
+        self.manifest.record(url, path, "downloaded", size=size, checksum=checksum)
+        self.metrics.record("download", status, hour=hour_key(url), path=path, size=size,
+                            staged_bytes=self.budget.used, **stats)
+        entry = {"hour": hour_key(url), "url": url, "path": path, "size": size,
+                 "checksum": checksum, "status": "downloaded"}
+        converter.submit(self.convert, entry)
+
+    def convert(self, entry):
+        started = time.time()
+        status, detail = "failed", None
+        try:
+            entry, status, detail = ingest_entry(self.con, entry, self.landing_dir)
+            record_ingest_result(self.manifest, entry, status, detail)
+            # raw bytes only stay on disk until they have been converted
+            if status == "ingested" and os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+        except Exception as e:
+            print(f"Error converting {entry['path']}: {e}")
+            detail = str(e)
+        finally:
+            # the budget is only given back once the raw file is gone; one that failed to
+            # convert is dropped too and fetched again on the next run
+            if status != "ingested" and os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+                self.manifest.record(entry["url"], entry["path"], "failed")
+            self.budget.release(entry["size"])
+            self.metrics.record("convert", status, hour=entry["hour"], convert_seconds=time.time() - started,
+                                rows=detail if status == "ingested" else None,
+                                error=detail if status != "ingested" else None)
+
+    def run_year(self, year):
+        save_dir = os.path.join(self.base_save_dir, str(year))
+        os.makedirs(save_dir, exist_ok=True)
+        os.makedirs(self.landing_dir, exist_ok=True)
+        ingested = self.manifest.ingested_hours(year)
+        staged = {entry["hour"]: entry for entry in self.manifest.entries(year, statuses=("downloaded", "verified"))}
+        hours = [(url, filename) for url, filename in iter_hours(year, save_dir) if hour_key(url) not in ingested]
+        # partial transfers left by an earlier run would sit on disk outside the budget
+        for _, filename in hours:
+            remove_part(filename)
+        self.metrics = IngestMetrics(self.metrics_dir, run_name=f"pipeline-{year}", total=len(hours))
+
+        print(f"Pipelining {len(hours)} {year} hours through {self.budget.budget_bytes / 1024**3:.1f} GB of staging")
+
+        with ThreadPoolExecutor(max_workers=self.convert_workers) as converter:
+            with ThreadPoolExecutor(max_workers=self.download_workers) as downloader:
+                for url, filename in hours:
+                    entry = staged.get(hour_key(url))
+                    if entry is not None and os.path.exists(entry["path"]):
+                        # left over from an interrupted run, convert without downloading again
+                        self.budget.add(entry["size"])
+                        converter.submit(self.convert, entry)
+                    else:
+                        downloader.submit(self.fetch, url, filename, converter)
+
+        self.metrics.summary(f"{year} pipeline")
+
+    def close(self):
+        self.con.close()
+        self.manifest.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download, verify, convert and delete GH Archive hours within a fixed disk budget")
+    parser.add_argument("years", nargs="*", type=int, default=[2019, 2020, 2021, 2022, 2023, 2024])
+    parser.add_argument("--base-dir", default="/home/strrl/ssd/gh_data")
+    parser.add_argument("--landing-dir", default="/home/strrl/ssd/gh_landing")
+    parser.add_argument("--staging-gb", type=float, default=20.0,
+                        help="raw .json.gz bytes allowed on disk at once; downloads pause when it is full")
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--convert-workers", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=20.0, help="maximum requests per second")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="per-file JSON lines and Prometheus snapshot output (default: <base-dir>/metrics)")
+    args = parser.parse_args()
+
+    pipeline = StagedPipeline(args.base_dir, args.landing_dir, int(args.staging_gb * 1024**3),
+                              args.download_workers, args.convert_workers, args.rate,
+                              args.metrics_dir or os.path.join(args.base_dir, "metrics"))
+    try:
+        for year in args.years:
+            pipeline.run_year(year)
+    finally:
+        pipeline.close()
@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def parse_retry_after(value, now=None):
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = now or datetime.now(timezone.utc)
+    return max((retry_at - now).total_seconds(), 0.0)
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                else:
+                    wait = (tokens - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        # every worker waits, not only the one that was throttled
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            self.tokens = 0.0
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill(self.clock())
+            self.rate = float(rate)
+
+class RateLimiter:
+    def __init__(self, rate=20.0, burst=None, min_rate=0.5, base_delay=1.0, max_delay=120.0,
+                 clock=time.monotonic, sleep=time.sleep, rng=None):
+        self.max_rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        self.throttled = 0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        self.bucket.acquire()
+
+    def backoff_delay(self, attempt, retry_after=None):
+        # full jitter exponential backoff, never shorter than the server asked for
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def on_success(self):
+        # additive increase back towards the configured rate
+        with self.lock:
+            if self.bucket.rate < self.max_rate:
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate + 0.1 * self.max_rate))
+
+    def on_failure(self, attempt, status=None, retry_after=None):
+        delay = self.backoff_delay(attempt, retry_after)
+        if status in RETRYABLE_STATUSES:
+            # a failing origin slows the whole pool, not just the worker that saw it
+            with self.lock:
+                self.throttled += 1
+                self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+            if status == 429 or retry_after is not None:
+                # and every worker waits when it was told to
+                self.bucket.pause(delay)
+        return delay
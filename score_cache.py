@@ -0,0 +1,89 @@
+import os
+import json
+import math
+import hashlib
+import sqlite3
+import threading
+
+from manifest import utc_now
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    fingerprint TEXT NOT NULL,
+    text_hash INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (fingerprint, text_hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS models (
+    fingerprint TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+# stays well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+def config_fingerprint(config):
+    return hashlib.md5(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def signed(value):
+    # text hashes are unsigned 64-bit, SQLite integers are signed
+    value = int(value)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+class ScoreCache:
+    def __init__(self, path, config):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.fingerprint = config_fingerprint(config)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO models (fingerprint, config, created_at) VALUES (?, ?, ?)",
+                (self.fingerprint, json.dumps(config, sort_keys=True), utc_now()),
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def lookup(self, hashes):
+        keys = {signed(h): int(h) for h in hashes}
+        found = {}
+        ordered = list(keys)
+        with self.lock:
+            for start in range(0, len(ordered), LOOKUP_CHUNK):
+                chunk = ordered[start:start + LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT text_hash, score FROM scores WHERE fingerprint = ? AND text_hash IN ({', '.join('?' for _ in chunk)})",
+                    (self.fingerprint, *chunk),
+                ).fetchall()
+                found.update((keys[key], score) for key, score in rows)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def insert(self, hashes, scores):
+        # texts the model failed on are left out, so a later run tries them again
+        rows = [(self.fingerprint, signed(h), float(score)) for h, score in zip(hashes, scores)
+                if not math.isnan(score)]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO scores (fingerprint, text_hash, score) VALUES (?, ?, ?)", rows,
+            )
+
+    def counts(self):
+        return self.hits, self.misses
+
+    def summary(self, title, since=(0, 0)):
+        hits, misses = self.hits - since[0], self.misses - since[1]
+        looked_up = hits + misses
+        print(f"{title}: {hits} of {looked_up} distinct texts served from the score cache "
+              f"({hits / max(looked_up, 1):.1%} hit rate), {misses} scored")
@@ -0,0 +1,74 @@
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from download import download_with_retry
+from rate_limit import RateLimiter
+
+HOUR_BODY = gzip.compress(b'{"type": "PushEvent"}\n' * 100)
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # each path answers with its queued (status, headers) responses in turn, then with the hour file
+    responses = {}
+    hits = {}
+
+    def do_GET(self):
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        queued = self.responses.get(self.path, [])
+        status, headers = queued.pop(0) if queued else (200, {})
+        body = HOUR_BODY if status == 200 else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    StandInHandler.responses, StandInHandler.hits = {}, {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def fetch(origin, path, responses, tmp_path, limiter):
+    StandInHandler.responses[path] = responses
+    filename = str(tmp_path / path.lstrip("/"))
+    return download_with_retry(origin + path, filename, limiter=limiter), filename
+
+def test_429_with_retry_after_pauses_every_worker_and_halves_the_rate(origin, tmp_path):
+    limiter = RateLimiter(rate=10, base_delay=0.01)
+    ok, filename = fetch(origin, "/throttled.json.gz", [(429, {"Retry-After": "1"})], tmp_path, limiter)
+    assert ok
+    with open(filename, "rb") as f:
+        assert f.read() == HOUR_BODY
+    assert StandInHandler.hits["/throttled.json.gz"] == 2
+    assert limiter.throttled == 1
+    assert limiter.bucket.paused_until > 0
+    # halved to 5, then one success adds back a tenth of the configured rate
+    assert limiter.rate == pytest.approx(6.0)
+
+def test_503_slows_the_shared_rate_without_pausing(origin, tmp_path):
+    limiter = RateLimiter(rate=10, base_delay=0.01)
+    ok, _ = fetch(origin, "/unavailable.json.gz", [(503, {}), (503, {})], tmp_path, limiter)
+    assert ok
+    assert StandInHandler.hits["/unavailable.json.gz"] == 3
+    assert limiter.throttled == 2
+    assert limiter.bucket.paused_until == 0.0
+    assert limiter.rate == pytest.approx(3.5)
+
+def test_404_is_not_retried_and_leaves_the_limiter_alone(origin, tmp_path):
+    limiter = RateLimiter(rate=10, base_delay=0.01)
+    ok, filename = fetch(origin, "/missing.json.gz", [(404, {})], tmp_path, limiter)
+    assert not ok
+    assert StandInHandler.hits["/missing.json.gz"] == 1
+    assert limiter.throttled == 0
+    assert limiter.rate == 10
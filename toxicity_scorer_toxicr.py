@@ -5,48 +5,63 @@ from tqdm import tqdm
 import warnings
 import os
 import sys
+import json
+import shutil
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 warnings.filterwarnings('ignore')
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from ToxiCRpreTrained import ToxiCR
+from batching import MAX_BATCH_SIZE, TOKEN_BUDGET, score_in_batches
+from score_cache import ScoreCache
+from transform import domain_bit, text_hash
 
-def process_parquet_with_toxicr(input_file, output_file):
-    print(f"Reading Parquet file: {input_file}")
-    
-    df = pd.read_parquet(input_file)
-    print(f"Loaded {len(df)} rows")
-    
-    if not hasattr(process_parquet_with_toxicr, "toxicr"):
+# rows read, scored and written at a time in streaming mode; memory is bounded by this, not the file
+STREAM_BATCH_ROWS = 50000
+# streamed output is committed in shards of at least this many rows, so a restart loses at most one
+CHECKPOINT_ROWS = 1000000
+SCORE_CACHE = "/home/strrl/ssd/score_cache.sqlite"
+
+# cached scores are keyed by this; any change to it (or to SCORE_VERSION) starts a fresh cache namespace
+TOXICR_CONFIG = {
+    "ALGO": "BERT",
+    "embedding": "bert",
+    "split_identifier": False,
+    "remove_keywords": True,
+    "count_profanity": False,
+}
+SCORE_VERSION = 1
+
+def load_toxicr():
+    if not hasattr(load_toxicr, "toxicr"):
+        # imported here, not at the top, so scoring workers can cap threads before the ML backend loads
+        from ToxiCRpreTrained import ToxiCR
         print(" Loading ToxiCR model ...")
-        toxicr = ToxiCR(
-            ALGO="BERT",
-            embedding="bert", 
-            split_identifier=False,
-            remove_keywords=True,
-            count_profanity=False
-        )
+        toxicr = ToxiCR(**TOXICR_CONFIG)
         
         if not toxicr.init_predictor():
             print("Failed to load ToxiCR model")
-            return False
+            return None
         
-        process_parquet_with_toxicr.toxicr = toxicr
+        load_toxicr.toxicr = toxicr
         print("ToxiCR model loaded successfully")
     else:
         print("Reusing existing ToxiCR model")
-    
-    toxicr = process_parquet_with_toxicr.toxicr
-    
-    texts = df['text'].fillna("").astype(str).tolist()
-    
-    print("Starting toxicity prediction with ToxiCR...")
-    
-    batch_size = 100
-    all_scores = []
-    
+    return load_toxicr.toxicr
+
+@contextmanager
+def quiet_tqdm():
+    # ToxiCR opens its own tqdm bar per call; silence it and hand back the real one for ours
     import tqdm as tqdm_module
     original_tqdm = tqdm_module.tqdm
 
@@ -71,59 +86,294 @@ def process_parquet_with_toxicr(input_file, output_file):
     
     tqdm_module.tqdm = SilentTqdm
     try:
-        print(f"Processing {len(texts)} texts...")
-        progress_bar = original_tqdm(total=len(texts), desc="   Processing", unit="texts")
-        
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i+batch_size]
-            
-            try:
-                # try batch processing
-                batch_scores = toxicr.get_toxicity_probability(batch_texts)
-                
-                if isinstance(batch_scores, (list, np.ndarray)):
-                    batch_scores = [float(score) for score in batch_scores]
-                else:
-                    batch_scores = [float(batch_scores)] * len(batch_texts)
-                    
-                all_scores.extend(batch_scores)
-                
-            except Exception as e:
-                # batch processing failed, process one by one
-                for text in batch_texts:
-                    try:
-                        score = toxicr.get_toxicity_probability([text])
-                        if isinstance(score, (list, np.ndarray)):
-                            score = float(score[0])
-                        else:
-                            score = float(score)
-                        all_scores.append(score)
-                    except Exception:
-                        all_scores.append(0.0)
-            
-            progress_bar.update(len(batch_texts))
-        
-        progress_bar.close()
-        
+        yield original_tqdm
     finally:
         # restore original tqdm
         tqdm_module.tqdm = original_tqdm
+
+def distinct_texts(df):
+    # identical texts ("LGTM", "+1", bot boilerplate) are scored once and the score joined back
+    all_texts = df['text'].fillna("").astype(str)
+    hashes = df['text_hash'] if 'text_hash' in df.columns else all_texts.map(text_hash)
+    first = ~hashes.duplicated()
+    return hashes, first, all_texts[first].tolist()
+
+def open_score_cache(path):
+    return ScoreCache(path, {**TOXICR_CONFIG, "score_version": SCORE_VERSION})
+
+def uncached_texts(cache, hashes, first, texts):
+    # texts scored by an earlier file, domain or run are looked up instead of going through the model
+    distinct = [int(h) for h in hashes[first]]
+    known = cache.lookup(distinct) if cache is not None else {}
+    missing = [(h, text) for h, text in zip(distinct, texts) if h not in known]
+    return known, [h for h, _ in missing], [text for _, text in missing]
+
+def store_scores(cache, known, missing, scores):
+    known.update(zip(missing, scores))
+    if cache is not None and missing:
+        cache.insert(missing, scores)
+    return known
+
+def join_scores(hashes, known):
+    # texts the model failed on keep the 0.0 they always got in the output, they are just never cached
+    return hashes.map(known).astype(float).fillna(0.0)
+
+def score_frame(toxicr, df, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE, progress=None, cache=None):
+    hashes, first, texts = distinct_texts(df)
+    known, missing, texts = uncached_texts(cache, hashes, first, texts)
+    # batches are bucketed by token length and capped by padded tokens, not by row count
+    scores = score_in_batches(toxicr.get_toxicity_probability, texts, token_budget, max_batch_size, progress=progress)
+    return join_scores(hashes, store_scores(cache, known, missing, scores)), int(first.sum())
+
+def worker_thread_env(threads):
+    return {
+        "OMP_NUM_THREADS": str(threads),
+        "MKL_NUM_THREADS": str(threads),
+        "OPENBLAS_NUM_THREADS": str(threads),
+        "TF_NUM_INTRAOP_THREADS": str(threads),
+        "TF_NUM_INTEROP_THREADS": "1",
+    }
+
+def init_worker(threads):
+    # each worker owns one predictor and a fixed share of the cores, so intra-op threads never oversubscribe;
+    # the thread variables are already in its environment (see make_scoring_pool), torch also needs telling
+    load_toxicr()
+    if threads and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+def score_shard(texts, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    with quiet_tqdm():
+        return score_in_batches(load_toxicr.toxicr.get_toxicity_probability, texts, token_budget, max_batch_size)
+
+def make_scoring_pool(workers, threads_per_worker=None):
+    if workers <= 1:
+        return None
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Starting {workers} scoring workers with {threads} threads each")
+    # spawned workers inherit os.environ and import numpy/pyarrow while unpickling init_worker, before it
+    # runs, so the caps are set here in the parent. the parent's own libraries are already loaded and keep
+    # their pools; the variables only take effect in processes started from now on
+    os.environ.update(worker_thread_env(threads))
+    # spawned, not forked, so no worker inherits thread pools the parent has already started
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_worker, initargs=(threads,))
+
+def process_parquet_with_toxicr(input_file, output_file, domain=None, token_budget=TOKEN_BUDGET,
+                                max_batch_size=MAX_BATCH_SIZE, cache=None):
+    print(f"Reading Parquet file: {input_file}")
+    
+    df = pd.read_parquet(input_file)
+    if domain is not None and 'domain_mask' in df.columns:
+        # transform.py output holds every domain once; keep the rows whose repo is in this one
+        df = df[(df['domain_mask'] & domain_bit(domain)) != 0].reset_index(drop=True)
+    print(f"Loaded {len(df)} rows")
+    
+    toxicr = load_toxicr()
+    if toxicr is None:
+        return False
     
-    # Add scores to dataframe
-    df['score'] = all_scores
+    print("Starting toxicity prediction with ToxiCR...")
+    with quiet_tqdm() as original_tqdm:
+        progress_bar = original_tqdm(total=len(df), desc="   Processing", unit="rows")
+        df['score'], distinct = score_frame(toxicr, df, token_budget, max_batch_size, cache=cache)
+        progress_bar.update(len(df))
+        progress_bar.close()
+    print(f"{distinct} distinct texts ({1 - distinct / max(len(df), 1):.1%} of rows were duplicates)")
+    all_scores = df['score']
     
     # Save results
     print(f"Saving results to: {output_file}")
-    df.to_parquet(output_file, index=False)
+    # renamed into place only once complete, since main skips any output file that exists
+    tmp_file = f"{output_file}.tmp"
+    df.to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
     
     print(f"Complete! Stats: Mean={np.mean(all_scores):.4f}, Min={np.min(all_scores):.4f}, Max={np.max(all_scores):.4f}")
     return True
 
-def main():
+def iter_input_batches(input_file, domain=None, batch_rows=STREAM_BATCH_ROWS):
+    # file by file, batch by batch, so only one batch of the input is ever in memory
+    dataset = ds.dataset(str(input_file), format="parquet", partitioning="hive")
+    selected = None
+    if domain is not None and 'domain_mask' in dataset.schema.names:
+        bit = pa.scalar(domain_bit(domain), pa.uint16())
+        selected = pc.not_equal(pc.bit_wise_and(pc.field('domain_mask'), bit), pa.scalar(0, pa.uint16()))
+    for fragment in dataset.get_fragments():
+        for batch in fragment.to_batches(schema=dataset.schema, filter=selected, batch_size=batch_rows):
+            if batch.num_rows:
+                yield batch
+
+def input_fingerprint(input_file, domain, batch_rows):
+    # batch boundaries depend on exactly these, so a checkpoint is only valid while they are unchanged
+    dataset = ds.dataset(str(input_file), format="parquet", partitioning="hive")
+    return {
+        "input": str(input_file),
+        "files": [[path, os.path.getsize(path)] for path in dataset.files],
+        "domain": domain,
+        "batch_rows": batch_rows,
+    }
+
+class ShardedOutput:
+    def __init__(self, output_file, fingerprint, checkpoint_rows=CHECKPOINT_ROWS):
+        self.output_file = output_file
+        self.parts_dir = f"{output_file}.parts"
+        self.progress_file = f"{output_file}.progress.json"
+        self.checkpoint_rows = checkpoint_rows
+        self.progress = self.load(fingerprint)
+        self.writer = None
+        self.pending = None
+
+    def load(self, fingerprint):
+        if os.path.exists(self.progress_file):
+            with open(self.progress_file) as f:
+                progress = json.load(f)
+            if progress["fingerprint"] == fingerprint:
+                print(f"Resuming after {progress['rows']} rows in {len(progress['parts'])} committed shards")
+                return progress
+            print(f"Input changed since {self.progress_file} was written, starting over")
+        if os.path.exists(self.parts_dir):
+            shutil.rmtree(self.parts_dir)
+        os.makedirs(self.parts_dir)
+        return {"fingerprint": fingerprint, "parts": [], "rows": 0, "distinct": 0, "total": 0.0, "low": None, "high": None}
+
+    def part_path(self, number):
+        return os.path.join(self.parts_dir, f"part-{number:05d}.parquet")
+
+    def write(self, table, scores, distinct):
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.part_path(len(self.progress["parts"])) + ".tmp", table.schema,
+                                           compression="zstd")
+            self.pending = {"rows": 0, "distinct": 0, "total": 0.0, "low": float("inf"), "high": float("-inf")}
+        self.writer.write_table(table)
+        self.pending["rows"] += table.num_rows
+        self.pending["distinct"] += distinct
+        self.pending["total"] += float(scores.sum())
+        self.pending["low"] = min(self.pending["low"], float(scores.min()))
+        self.pending["high"] = max(self.pending["high"], float(scores.max()))
+        if self.pending["rows"] >= self.checkpoint_rows:
+            self.commit()
+
+    def commit(self):
+        # the part is renamed into place first and the progress file rewritten after, so a crash
+        # in between only costs this shard; the uncommitted part is overwritten on resume
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        path = self.part_path(len(self.progress["parts"]))
+        os.replace(path + ".tmp", path)
+        progress, pending = self.progress, self.pending
+        progress["parts"].append({"part": os.path.basename(path), "start": progress["rows"],
+                                  "end": progress["rows"] + pending["rows"]})
+        progress["rows"] += pending["rows"]
+        progress["distinct"] += pending["distinct"]
+        progress["total"] += pending["total"]
+        progress["low"] = pending["low"] if progress["low"] is None else min(progress["low"], pending["low"])
+        progress["high"] = pending["high"] if progress["high"] is None else max(progress["high"], pending["high"])
+        with open(self.progress_file + ".tmp", 'w') as f:
+            json.dump(progress, f)
+        os.replace(self.progress_file + ".tmp", self.progress_file)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def finalize(self):
+        self.commit()
+        if self.progress["rows"]:
+            # parts are copied row group by row group, then the finished file is renamed into place
+            tmp_file = f"{self.output_file}.tmp"
+            writer = None
+            for part in self.progress["parts"]:
+                part_file = pq.ParquetFile(os.path.join(self.parts_dir, part["part"]))
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_file, part_file.schema_arrow, compression="zstd")
+                for i in range(part_file.num_row_groups):
+                    writer.write_table(part_file.read_row_group(i))
+            writer.close()
+            os.replace(tmp_file, self.output_file)
+        shutil.rmtree(self.parts_dir)
+        if os.path.exists(self.progress_file):
+            os.remove(self.progress_file)
+        return self.progress
+
+def stream_parquet_with_toxicr(input_file, output_file, domain=None, batch_rows=STREAM_BATCH_ROWS,
+                               token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE, pool=None, workers=1,
+                               checkpoint_rows=CHECKPOINT_ROWS, cache=None):
+    print(f"Streaming Parquet input: {input_file}")
+    if pool is None and load_toxicr() is None:
+        return False
+
+    # each batch is a row-range shard; shards run on the pool but are written back in input order
+    window = workers * 2 if pool is not None else 1
+    pending = deque()
+    output = ShardedOutput(output_file, input_fingerprint(input_file, domain, batch_rows), checkpoint_rows)
+    committed = output.progress["rows"]
+
+    def submit(texts):
+        if not texts:
+            future = Future()
+            future.set_result([])
+            return future
+        if pool is not None:
+            return pool.submit(score_shard, texts, token_budget, max_batch_size)
+        future = Future()
+        future.set_result(score_shard(texts, token_budget, max_batch_size))
+        return future
+
+    def write_next():
+        batch, hashes, first, known, missing, future = pending.popleft()
+        scores = join_scores(hashes, store_scores(cache, known, missing, future.result()))
+        table = pa.Table.from_batches([batch]).append_column("score", pa.array(scores.to_numpy(), pa.float64()))
+        output.write(table, scores, int(first.sum()))
+        progress_bar.update(batch.num_rows)
+
+    progress_bar = tqdm(desc="   Processing", unit="rows", initial=committed)
+    try:
+        seen = 0
+        for batch in iter_input_batches(input_file, domain, batch_rows):
+            seen += batch.num_rows
+            if seen <= committed:
+                continue
+            hashes, first, texts = distinct_texts(batch.to_pandas())
+            known, missing, texts = uncached_texts(cache, hashes, first, texts)
+            pending.append((batch, hashes, first, known, missing, submit(texts)))
+            while len(pending) >= window:
+                write_next()
+        while pending:
+            write_next()
+    except BaseException:
+        # the open part is left uncommitted; the next run resumes after the last committed one
+        output.close()
+        raise
+    finally:
+        progress_bar.close()
+        for *_, future in pending:
+            future.cancel()
+
+    progress = output.finalize()
+    if not progress["rows"]:
+        print(f"No rows to score in {input_file}")
+        return False
+    print(f"{progress['rows']} rows scored, {progress['distinct']} distinct texts within batches")
+    print(f"Complete! Stats: Mean={progress['total'] / progress['rows']:.4f}, "
+          f"Min={progress['low']:.4f}, Max={progress['high']:.4f}")
+    return True
+
+def find_input(base_path, folder, year):
+    # transform.py writes comments/year=<year>/ for all domains; duckDB.sql runs write score_<domain>/<year>.parquet
+    partition = Path(base_path) / "comments" / f"year={year}"
+    if partition.exists():
+        return partition
+    return Path(base_path) / folder / f"{year}.parquet"
+
+def main(stream=True, batch_rows=STREAM_BATCH_ROWS, token_budget=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE,
+         workers=1, threads_per_worker=None, checkpoint_rows=CHECKPOINT_ROWS, score_cache=SCORE_CACHE):
     base_path = "/home/strrl/ssd"
     folders = ["score_devops", "score_frontend", "score_game", "score_mobile", "score_ml"]
     years = [2019, 2020, 2021, 2022, 2023, 2024]
-    print("Starting ToxiCR scoring ...")
+    print("Starting ToxiCR scoring" + (" (streaming) ..." if stream else " ..."))
     print("=" * 50)
 
     total_files = len(folders) * len(years)
@@ -131,23 +381,21 @@ def main():
     failed_files = []
 
     overall_progress = tqdm(total=total_files, desc="Overall Progress", unit="files")
+    # workers load the model once for the whole run; sharded scoring goes through the streaming path
+    pool = make_scoring_pool(workers, threads_per_worker)
+    stream = stream or pool is not None
+    cache = open_score_cache(score_cache) if score_cache else None
 
     for folder in folders:
         print(f"\nProcessing folder: {folder}")
         print("-" * 40)
         
         folder_path = Path(base_path) / folder
-        
-        # check if folder exists
-        if not folder_path.exists():
-            print(f"Folder {folder_path} does not exist, skipping...")
-            overall_progress.update(len(years))
-            failed_files.extend([f"{folder}/{year}.parquet" for year in years])
-            continue
+        folder_path.mkdir(parents=True, exist_ok=True)
         
         # iterate over each year
         for year in years:
-            input_file = folder_path / f"{year}.parquet"
+            input_file = find_input(base_path, folder, year)
             output_file = folder_path / f"{year}_toxicr_score.parquet"
             
             print(f"\nProcessing: {folder}/{year}.parquet")
@@ -165,7 +413,17 @@ def main():
                 
                 # process file
                 try:
-                    success = process_parquet_with_toxicr(str(input_file), str(output_file))
+                    domain = folder[len('score_'):]
+                    before = cache.counts() if cache is not None else None
+                    if stream:
+                        success = stream_parquet_with_toxicr(str(input_file), str(output_file), domain, batch_rows,
+                                                             token_budget, max_batch_size, pool, workers,
+                                                             checkpoint_rows, cache)
+                    else:
+                        success = process_parquet_with_toxicr(str(input_file), str(output_file), domain,
+                                                              token_budget, max_batch_size, cache)
+                    if cache is not None:
+                        cache.summary(f"{folder}/{year}", before)
                     if success:
                         processed_files += 1
                         print(f"Successfully processed {folder}/{year}.parquet")
@@ -180,6 +438,8 @@ def main():
             overall_progress.update(1)
     
     overall_progress.close()
+    if pool is not None:
+        pool.shutdown()
     
     print("\n" + "=" * 60)
     print("FINAL SUMMARY")
@@ -195,7 +455,27 @@ def main():
     
     print(f"\nBatch processing complete!")
     print(f"Success rate: {processed_files/total_files*100:.1f}%")
+    if cache is not None:
+        cache.summary("Score cache")
+        cache.close()
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Score domain comments with ToxiCR")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="load each file whole with pandas instead of streaming it in checkpointed batches")
+    parser.add_argument("--batch-rows", type=int, default=STREAM_BATCH_ROWS, help="rows per streamed batch")
+    parser.add_argument("--token-budget", type=int, default=TOKEN_BUDGET, help="padded tokens per inference batch")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE, help="rows per inference batch")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="scoring processes, each with its own ToxiCR predictor (always streams when > 1)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--checkpoint-rows", type=int, default=CHECKPOINT_ROWS,
+                        help="streamed output is committed every this many rows; a restart resumes from the last commit")
+    parser.add_argument("--score-cache", default=SCORE_CACHE,
+                        help="SQLite cache of scores by text hash and model config, shared across runs ('' disables it)")
+    args = parser.parse_args()
+
+    main(not args.in_memory, args.batch_rows, args.token_budget, args.max_batch_size, args.workers, args.threads_per_worker,
+         args.checkpoint_rows, args.score_cache) 
\ No newline at end of file
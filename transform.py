@@ -0,0 +1,502 @@
+import os
+import re
+import argparse
+import glob
+import hashlib
+import shutil
+import time
+from collections import defaultdict
+
+import duckdb
+
+from manifest import DownloadManifest
+from metrics import StageProfile
+
+DOMAINS = ["ml", "devops", "frontend", "game", "mobile"]
+
+# issue comments hang off payload.issue, review comments off payload.pull_request,
+# and review bodies live in payload.review rather than payload.comment
+COMMENT_EVENT_TYPES = ["IssueCommentEvent", "PullRequestReviewCommentEvent", "PullRequestReviewEvent"]
+COMMENT_TYPES = "(" + ", ".join(f"'{event_type}'" for event_type in COMMENT_EVENT_TYPES) + ")"
+
+# every event type is projected onto the same columns in one scan, then filtered once
+COMMENT_FILTER = """
+WHERE
+  comment_id IS NOT NULL
+  AND text IS NOT NULL
+  AND LENGTH(text) > 0
+  AND issue_or_pr_id IS NOT NULL
+"""
+
+# filtered_comments from duckDB.sql, reading either the ingest.py landing zone or raw hour files
+LANDING_COMMENTS = """
+SELECT * FROM (
+  SELECT
+    repo_name AS repo,
+    event_id,
+    event_type,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_id ELSE comment_id END AS comment_id,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_url ELSE comment_url END AS comment_url,
+    CASE WHEN event_type = 'IssueCommentEvent' THEN issue_id ELSE pull_request_id END AS issue_or_pr_id,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_user_login ELSE comment_user_login END AS user_login,
+    CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_submitted_at ELSE comment_created_at END AS created_at,
+    TRIM(CASE WHEN event_type = 'PullRequestReviewEvent' THEN review_body ELSE comment_body END) AS text
+  FROM read_parquet({files}, hive_partitioning = true)
+  WHERE event_type IN {comment_types}
+)
+""" + COMMENT_FILTER
+
+# download.py --filter already wrote the filtered_comments columns, one <hour>.parquet per hour
+FILTERED_COMMENTS = """
+SELECT * FROM (
+  SELECT * REPLACE (timezone('UTC', created_at) AS created_at)
+  FROM read_parquet({files})
+  WHERE event_type IN {comment_types}
+)
+""" + COMMENT_FILTER
+
+# only the paths filtered_comments reads; everything else in payload is skipped by the JSON reader
+RAW_COLUMNS = {
+    "id": "VARCHAR",
+    "type": "VARCHAR",
+    "repo": "STRUCT(name VARCHAR)",
+    "payload": (
+        "STRUCT("
+        'comment STRUCT(id BIGINT, html_url VARCHAR, body VARCHAR, "user" STRUCT(login VARCHAR), created_at TIMESTAMP), '
+        'review STRUCT(id BIGINT, html_url VARCHAR, body VARCHAR, "user" STRUCT(login VARCHAR), submitted_at TIMESTAMP), '
+        "issue STRUCT(id BIGINT), "
+        "pull_request STRUCT(id BIGINT)"
+        ")"
+    ),
+}
+
+RAW_COMMENTS = """
+SELECT * FROM (
+  SELECT
+    repo.name AS repo,
+    id AS event_id,
+    type AS event_type,
+    CASE WHEN type = 'PullRequestReviewEvent' THEN payload.review.id ELSE payload.comment.id END AS comment_id,
+    CASE WHEN type = 'PullRequestReviewEvent' THEN payload.review.html_url ELSE payload.comment.html_url END AS comment_url,
+    CASE WHEN type = 'IssueCommentEvent' THEN payload.issue.id ELSE payload.pull_request.id END AS issue_or_pr_id,
+    CASE WHEN type = 'PullRequestReviewEvent' THEN payload.review.user.login ELSE payload.comment.user.login END AS user_login,
+    CASE WHEN type = 'PullRequestReviewEvent' THEN payload.review.submitted_at ELSE payload.comment.created_at END AS created_at,
+    TRIM(CASE WHEN type = 'PullRequestReviewEvent' THEN payload.review.body ELSE payload.comment.body END) AS text
+  FROM {raw_source}
+  WHERE type IN {comment_types}
+)
+""" + COMMENT_FILTER
+
+BOT_LOGIN = """
+    LOWER(login) LIKE '%[bot]%' OR
+    LOWER(login) LIKE '%bot' OR
+    LOWER(login) LIKE 'bot_%' OR
+    LOWER(login) LIKE 'bot-%' OR
+    LOWER(login) LIKE '%-bot%' OR
+    LOWER(login) LIKE '%_bot%' OR
+    LOWER(login) IN ('dependabot', 'github-actions', 'renovate', 'semantic-release', 'prettier-ci')
+"""
+
+# whitespace-normalized text hashed to 64 bits; text_hash() below must stay identical to it
+TEXT_HASH = r"md5_number_lower(TRIM(regexp_replace(text, '[\t\n\f\r ]+', ' ', 'g')))"
+
+# bump whenever BOT_LOGIN changes so stored classifications are redone
+BOT_RULES_VERSION = 1
+
+def text_hash(text):
+    normalized = re.sub(r"[\t\n\f\r ]+", " ", text).strip(" ")
+    return int.from_bytes(hashlib.md5(normalized.encode("utf-8")).digest()[8:], "little")
+
+def sql_files(paths):
+    if isinstance(paths, str):
+        return f"'{paths}'"
+    return "[" + ", ".join(f"'{path}'" for path in paths) + "]"
+
+def raw_source(paths, declared=True):
+    if not declared:
+        return f"read_ndjson_auto({sql_files(paths)})"
+    columns = ", ".join(f"'{name}': '{sql_type}'" for name, sql_type in RAW_COLUMNS.items())
+    return f"read_json({sql_files(paths)}, format = 'newline_delimited', columns = {{{columns}}})"
+
+def source_files(year, source, landing_dir, raw_dir, hours=None):
+    # hour -> files; landing hours are split across event_type partitions, raw and filtered hours are one file
+    if source == "landing":
+        paths = []
+        for event_type in COMMENT_EVENT_TYPES:
+            paths += glob.glob(os.path.join(landing_dir, f"year={year}", "*", "*", f"event_type={event_type}", "h*.parquet"))
+        hour_of = lambda path: os.path.basename(path)[1:].rsplit("_", 1)[0]
+    elif source == "filtered":
+        paths = glob.glob(os.path.join(raw_dir, str(year), f"{year}-*.parquet"))
+        hour_of = lambda path: os.path.basename(path)[:-len(".parquet")]
+    else:
+        paths = glob.glob(os.path.join(raw_dir, str(year), f"{year}-*.json.gz"))
+        hour_of = lambda path: os.path.basename(path)[:-len(".json.gz")]
+    files = defaultdict(list)
+    for path in sorted(paths):
+        if hours is None or hour_of(path) in hours:
+            files[hour_of(path)].append(path)
+    return files
+
+def domain_bit(domain):
+    # bit positions follow DOMAINS, so new domains must be appended to keep stored masks valid
+    return 1 << DOMAINS.index(domain)
+
+def domain_mask(domains):
+    mask = 0
+    for domain in domains:
+        mask |= domain_bit(domain)
+    return mask
+
+def scraper_files(repo_dir):
+    files = []
+    for domain in DOMAINS:
+        for path in sorted(glob.glob(os.path.join(repo_dir, f"github_{domain}_repos_*.parquet"))):
+            year = os.path.basename(path)[len(f"github_{domain}_repos_"):-len(".parquet")]
+            if year.isdigit():
+                files.append((domain, int(year), path))
+    return files
+
+def build_repo_dimension(con, repo_dir):
+    # every scraper output folded into one row per repo and year, so each year needs a single hash join;
+    # domains stay per year, a repo listed as devops in 2019 and ml in 2020 is not ml in 2019
+    files = scraper_files(repo_dir)
+    if not files:
+        print(f"No scraper outputs in {repo_dir}")
+        return 0
+    selects = [
+        f"SELECT full_name, {year} AS year, {domain_bit(domain)} AS domain_bit FROM read_parquet('{path}')"
+        for domain, year, path in files
+    ]
+    con.execute(f"""
+        CREATE OR REPLACE TABLE repo_domains AS
+        SELECT
+          full_name,
+          year::SMALLINT AS year,
+          BIT_OR(domain_bit)::USMALLINT AS domain_mask
+        FROM ({" UNION ALL ".join(selects)})
+        GROUP BY full_name, year
+    """)
+    repos, shared = con.execute(
+        "SELECT COUNT(DISTINCT full_name), COUNT(*) FILTER (WHERE bit_count(domain_mask) > 1) FROM repo_domains"
+    ).fetchone()
+    print(f"Repo dimension: {repos} repos from {len(files)} scraper files, {shared} repo-years in more than one domain")
+    return repos
+
+def update_bot_logins(con, year, profile, comments="domain_comments"):
+    # classify each distinct login once instead of running the LIKE cascade on every comment
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS bot_logins (
+          login VARCHAR PRIMARY KEY,
+          is_bot BOOLEAN NOT NULL,
+          rules_version INTEGER NOT NULL,
+          first_seen_year INTEGER
+        )
+    """)
+    con.execute(f"""
+        UPDATE bot_logins SET is_bot = ({BOT_LOGIN}), rules_version = {BOT_RULES_VERSION}
+        WHERE rules_version <> {BOT_RULES_VERSION}
+    """)
+    added = profile.run(con, year, "bot_logins", f"""
+        INSERT INTO bot_logins
+        SELECT login, ({BOT_LOGIN}) AS is_bot, {BOT_RULES_VERSION}, {year}
+        FROM (SELECT DISTINCT user_login AS login FROM {comments} WHERE user_login IS NOT NULL) new
+        WHERE NOT EXISTS (SELECT 1 FROM bot_logins b WHERE b.login = new.login)
+    """)[0]
+    total, bots = con.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE is_bot) FROM bot_logins").fetchone()
+    print(f"Login dimension: {added} new logins, {total} total, {bots} classified as bots")
+    return added
+
+def create_comment_views(con, year, source, files, profile, domains=DOMAINS, incremental=False):
+    template = {"landing": LANDING_COMMENTS, "filtered": FILTERED_COMMENTS}.get(source, RAW_COMMENTS)
+    con.execute("CREATE OR REPLACE TEMP VIEW filtered_comments AS " + template.format(
+        files=sql_files(files), comment_types=COMMENT_TYPES, raw_source=raw_source(files)))
+    # the repo join is selective, so only its output is kept to collect logins and filter bots;
+    # a repo in several domains stays one row, its membership carried in domain_mask.
+    # overlapping or replayed hour files repeat comments, so each comment is kept once per
+    # scan and, when appending, only if the year's seen_comments index does not have it yet
+    already_seen = f"""
+          AND NOT EXISTS (
+            SELECT 1 FROM seen_comments s
+            WHERE s.year = {year} AND s.event_type = c.event_type AND s.comment_id = c.comment_id
+          )""" if incremental else ""
+    profile.run(con, year, "extract", f"""
+        CREATE OR REPLACE TEMP TABLE domain_comments AS
+        SELECT DISTINCT ON (c.event_type, c.comment_id)
+          c.*, (r.domain_mask & {domain_mask(domains)})::USMALLINT AS domain_mask
+        FROM filtered_comments c
+        INNER JOIN repo_domains r
+        ON c.repo = r.full_name AND r.year = {year}
+        WHERE r.domain_mask & {domain_mask(domains)} <> 0{already_seen}
+        ORDER BY c.event_type, c.comment_id, c.event_id
+    """)
+    update_bot_logins(con, year, profile)
+    # NULL logins were dropped by the LIKE cascade as well
+    con.execute("""
+        CREATE OR REPLACE TEMP VIEW filtered_comments_repo AS
+        SELECT c.*
+        FROM domain_comments c
+        ANTI JOIN (SELECT login FROM bot_logins WHERE is_bot) b
+        ON c.user_login = b.login
+        WHERE c.user_login IS NOT NULL
+    """)
+
+def create_state_tables(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS transformed_hours (
+          hour VARCHAR PRIMARY KEY,
+          year INTEGER NOT NULL,
+          source VARCHAR NOT NULL,
+          batch VARCHAR NOT NULL,
+          transformed_at TIMESTAMP NOT NULL
+        )
+    """)
+    # review ids and comment ids are separate GitHub sequences, hence event_type in the key
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS seen_comments (
+          year SMALLINT NOT NULL,
+          event_type VARCHAR NOT NULL,
+          comment_id BIGINT NOT NULL
+        )
+    """)
+
+def transformed_hours(con, year):
+    return {row[0] for row in con.execute("SELECT hour FROM transformed_hours WHERE year = ?", [year]).fetchall()}
+
+def record_hours(con, year, source, batch, hours, seen_files, replace_year=False):
+    # the watermark and the seen-comment index move together, so a rerun never sees one without the other
+    con.execute("BEGIN TRANSACTION")
+    if replace_year:
+        con.execute("DELETE FROM transformed_hours WHERE year = ?", [year])
+        con.execute("DELETE FROM seen_comments WHERE year = ?", [year])
+    else:
+        con.execute("DELETE FROM transformed_hours WHERE list_contains(?, hour)", [sorted(hours)])
+    con.executemany(
+        "INSERT INTO transformed_hours VALUES (?, ?, ?, ?, now())",
+        [[hour, year, source, batch] for hour in sorted(hours)],
+    )
+    if seen_files:
+        con.execute(f"""
+            INSERT INTO seen_comments
+            SELECT {year}, event_type, comment_id FROM read_parquet({sql_files(seen_files)})
+            ORDER BY event_type, comment_id
+        """)
+    con.execute("COMMIT")
+
+def write_comment_ids(con, path):
+    con.execute(f"""
+        COPY (SELECT event_type, comment_id FROM filtered_comments_repo)
+        TO '{path}' (FORMAT parquet, COMPRESSION zstd)
+    """)
+
+def write_comments(con, year, target_dir, row_group_size, profile, filename="data_0"):
+    # sorted by repo then time, so row group min/max statistics let readers skip by repo or date.
+    # PARTITION_BY does not keep ORDER BY within its files, so each month is its own sorted COPY
+    months = con.execute(
+        "SELECT DISTINCT MONTH(created_at) AS month FROM filtered_comments_repo ORDER BY month"
+    ).fetchall()
+    rows = 0
+    for (month,) in months:
+        month = "NULL" if month is None else month
+        month_dir = os.path.join(target_dir, f"year={year}", f"month={month}")
+        os.makedirs(month_dir, exist_ok=True)
+        path = os.path.join(month_dir, f"{filename}.parquet")
+        rows += profile.run(con, year, f"write-{month}", f"""
+            COPY (
+              SELECT *, {TEXT_HASH} AS text_hash
+              FROM filtered_comments_repo
+              WHERE MONTH(created_at) IS NOT DISTINCT FROM {month}
+              ORDER BY repo, created_at
+            ) TO '{path}' (
+              FORMAT parquet,
+              COMPRESSION zstd,
+              ROW_GROUP_SIZE {row_group_size}
+            )
+        """, output=path)[0]
+    return rows
+
+def publish_partitions(staging_dir, output_dir, year):
+    # swap the year partition in whole, so reruns never leave stale files behind. called only once
+    # the staging write has finished; the old year is moved aside, not deleted, until the new one is
+    # in place. a year that matched no rows is published empty
+    source = os.path.join(staging_dir, f"year={year}")
+    target = os.path.join(output_dir, f"year={year}")
+    retired = os.path.join(output_dir, f".retired-{year}")
+    os.makedirs(source, exist_ok=True)
+    if os.path.exists(retired):
+        shutil.rmtree(retired)
+    if os.path.exists(target):
+        os.replace(target, retired)
+    os.replace(source, target)
+    shutil.rmtree(staging_dir)
+    if os.path.exists(retired):
+        shutil.rmtree(retired)
+
+def commit_append(con, append_dir, output_dir, year, source):
+    # the hours file is written only once the COPY has finished; without it the batch is discarded.
+    # with it, the files are moved into place and the watermark advances, which a rerun can redo
+    hours_file = os.path.join(append_dir, "_hours")
+    if not os.path.exists(hours_file):
+        shutil.rmtree(append_dir)
+        return False
+    with open(hours_file) as f:
+        hours = {line.strip() for line in f if line.strip()}
+    for root, _, names in os.walk(append_dir):
+        for name in names:
+            if not name.endswith(".parquet") or name.startswith("_"):
+                continue
+            target = os.path.join(output_dir, os.path.relpath(os.path.join(root, name), append_dir))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(root, name), target)
+    batch = os.path.basename(append_dir).rsplit("-", 1)[1]
+    record_hours(con, year, source, batch, hours, os.path.join(append_dir, "_comment_ids.parquet"))
+    shutil.rmtree(append_dir)
+    return True
+
+def recover_appends(con, output_dir, year, source, discard=False):
+    for append_dir in sorted(glob.glob(os.path.join(output_dir, f".append-{year}-*"))):
+        if discard:
+            shutil.rmtree(append_dir)
+        elif commit_append(con, append_dir, output_dir, year, source):
+            print(f"Finished interrupted append {append_dir}")
+
+def available_hours(year, source, manifest_file):
+    # the landing zone is only read for hours ingest.py has finished, never for one mid-COPY
+    if source != "landing" or not manifest_file or not os.path.exists(manifest_file):
+        return None
+    manifest = DownloadManifest(manifest_file)
+    try:
+        return manifest.ingested_hours(year)
+    finally:
+        manifest.close()
+
+def write_unique_texts(con, year, texts_dir, profile, merge=False):
+    # one row per distinct text across every domain, so each is scored once and joined back on text_hash.
+    # built from the rows just written; an append folds its counts into the year's existing table
+    # instead of rescanning the whole year
+    os.makedirs(texts_dir, exist_ok=True)
+    target = os.path.join(texts_dir, f"{year}.parquet")
+    tmp_path = target + ".tmp"
+    texts = f"SELECT {TEXT_HASH} AS text_hash, text, 1 AS occurrences FROM filtered_comments_repo"
+    if merge and os.path.exists(target):
+        texts += f" UNION ALL SELECT text_hash, text, occurrences FROM read_parquet('{target}')"
+    profile.run(con, year, "texts", f"""
+        COPY (
+          SELECT text_hash, any_value(text) AS text, SUM(occurrences)::BIGINT AS occurrences
+          FROM ({texts})
+          GROUP BY text_hash
+          ORDER BY occurrences DESC
+        ) TO '{tmp_path}' (FORMAT parquet, COMPRESSION zstd)
+    """, output=tmp_path)
+    os.replace(tmp_path, target)
+    texts, rows = con.execute(f"SELECT COUNT(*), COALESCE(SUM(occurrences), 0) FROM read_parquet('{target}')").fetchone()
+    print(f"{year}: {texts} distinct texts for {rows} comments ({(rows - texts) / max(rows, 1):.1%} duplicates) in {target}")
+    return texts
+
+def transform_year(con, year, output_dir, domains=DOMAINS, source="landing",
+                   landing_dir="/home/strrl/ssd/gh_landing", raw_dir="/home/strrl/ssd/gh_data",
+                   row_group_size=65536, incremental=False, manifest_file=None, texts_dir=None, profile=None):
+    profile = profile or StageProfile()
+    active = con.execute(f"SELECT COUNT(*) FROM repo_domains WHERE year = {year}").fetchone()[0]
+    if not active:
+        print(f"No repo lists for {year}, nothing to do")
+        return 0
+
+    os.makedirs(output_dir, exist_ok=True)
+    create_state_tables(con)
+    recover_appends(con, output_dir, year, source, discard=not incremental)
+
+    files = source_files(year, source, landing_dir, raw_dir, available_hours(year, source, manifest_file))
+    if incremental:
+        done = transformed_hours(con, year)
+        files = {hour: paths for hour, paths in files.items() if hour not in done}
+    if not files:
+        print(f"{year}: no new {source} hours to transform")
+        return 0
+
+    mode = "incremental" if incremental else "full"
+    print(f"Transforming {len(files)} {year} hours for {', '.join(domains)} in a single {source} scan ({mode})")
+    started = time.time()
+    create_comment_views(con, year, source, [path for paths in files.values() for path in paths], profile, domains,
+                         incremental)
+
+    batch = time.strftime("%Y%m%dT%H%M%S")
+    if incremental:
+        # new files get a batch-specific name so they sit beside the existing ones in each partition
+        append_dir = os.path.join(output_dir, f".append-{year}-{batch}")
+        rows = write_comments(con, year, append_dir, row_group_size, profile, filename=f"b{batch}")
+        os.makedirs(append_dir, exist_ok=True)
+        write_comment_ids(con, os.path.join(append_dir, "_comment_ids.parquet"))
+        with open(os.path.join(append_dir, "_hours"), 'w') as f:
+            f.write("\n".join(sorted(files)) + "\n")
+        commit_append(con, append_dir, output_dir, year, source)
+    else:
+        staging_dir = os.path.join(output_dir, f".staging-{year}")
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+        os.makedirs(staging_dir)
+        rows = write_comments(con, year, staging_dir, row_group_size, profile)
+        publish_partitions(staging_dir, output_dir, year)
+        record_hours(con, year, source, batch, files, glob.glob(os.path.join(output_dir, f"year={year}", "*", "*.parquet")),
+                     replace_year=True)
+
+    print(f"{year}: {rows} comment rows written to {output_dir} in {time.time() - started:.1f}s")
+    if texts_dir:
+        write_unique_texts(con, year, texts_dir, profile, merge=incremental)
+    return rows
+
+def configure_connection(con, memory_limit=None, threads=None, temp_dir=None, max_temp_size=None):
+    # explicit limits so large COPYs spill to the chosen disk instead of wherever DuckDB defaults to
+    if memory_limit is None:
+        memory_limit = f"{int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.6 / 1024**3)}GB"
+    threads = threads or os.cpu_count()
+    con.execute(f"SET memory_limit = '{memory_limit}'")
+    con.execute(f"SET threads = {threads}")
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+        con.execute(f"SET temp_directory = '{temp_dir}'")
+    if max_temp_size:
+        con.execute(f"SET max_temp_directory_size = '{max_temp_size}'")
+    con.execute("SET enable_progress_bar = true")
+    con.execute("SET enable_profiling = 'no_output'")
+    print(f"DuckDB: memory_limit={memory_limit}, threads={threads}, temp_directory={temp_dir or 'default'}"
+          + (f", max_temp_directory_size={max_temp_size}" if max_temp_size else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract domain comments from GH Archive with one scan per year")
+    parser.add_argument("years", nargs="*", type=int, default=[2019, 2020, 2021, 2022, 2023, 2024])
+    parser.add_argument("--domains", nargs="+", default=DOMAINS, choices=DOMAINS,
+                        help="domains kept in the output; a full run rewrites the year with only these")
+    parser.add_argument("--source", choices=["landing", "raw", "filtered"], default="landing",
+                        help="read the ingest.py Parquet landing zone, the raw .json.gz hour files, "
+                             "or the <hour>.parquet files of download.py --filter (both under --raw-dir)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only transform hours not yet recorded in the database and append their rows")
+    parser.add_argument("--landing-dir", default="/home/strrl/ssd/gh_landing")
+    parser.add_argument("--raw-dir", default="/home/strrl/ssd/gh_data")
+    parser.add_argument("--manifest", default="/home/strrl/ssd/gh_data/manifest.sqlite",
+                        help="download manifest whose ingested hours bound what is read from the landing zone")
+    parser.add_argument("--repo-dir", default="/home/strrl/ssd/repo")
+    parser.add_argument("--output-dir", default="/home/strrl/ssd/comments")
+    parser.add_argument("--texts-dir", default="/home/strrl/ssd/texts",
+                        help="where each year's distinct comment texts (text_hash, text, occurrences) are written")
+    parser.add_argument("--row-group-size", type=int, default=65536,
+                        help="rows per Parquet row group; smaller groups prune more finely")
+    parser.add_argument("--database", default="/home/strrl/ssd/transform.duckdb",
+                        help="DuckDB file holding the repo and bot login dimensions and the transformed-hours watermark")
+    parser.add_argument("--memory-limit", default=None, help="DuckDB memory_limit, e.g. 48GB (default: 60%% of RAM)")
+    parser.add_argument("--threads", type=int, default=None, help="DuckDB worker threads (default: all cores)")
+    parser.add_argument("--temp-dir", default="/home/strrl/ssd/duckdb_tmp", help="where DuckDB spills when over the memory limit")
+    parser.add_argument("--max-temp-size", default=None, help="cap on spilled bytes, e.g. 200GB")
+    parser.add_argument("--profile-dir", default="/home/strrl/ssd/transform_profiles",
+                        help="per-run stage metrics (stages.jsonl) and EXPLAIN ANALYZE plans per stage")
+    args = parser.parse_args()
+
+    con = duckdb.connect(args.database)
+    configure_connection(con, args.memory_limit, args.threads, args.temp_dir, args.max_temp_size)
+    profile = StageProfile(args.profile_dir)
+    build_repo_dimension(con, args.repo_dir)
+    for year in args.years:
+        transform_year(con, year, args.output_dir, args.domains, args.source,
+                       args.landing_dir, args.raw_dir, args.row_group_size, args.incremental, args.manifest,
+                       args.texts_dir, profile)
+    con.close()
@@ -0,0 +1,48 @@
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_SIZE = 256 * 1024
+
+def verify_gzip_stream(filename, chunk_size=CHUNK_SIZE):
+    # zlib in gzip mode checks each member's CRC32 and ISIZE trailer and raises on mismatch;
+    # GH Archive files may hold several concatenated members
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    members = 0
+    in_member = False
+    uncompressed = 0
+
+    try:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                while chunk:
+                    in_member = True
+                    uncompressed += len(decompressor.decompress(chunk))
+                    if not decompressor.eof:
+                        break
+                    members += 1
+                    in_member = False
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    except (OSError, zlib.error) as e:
+        return False, str(e), uncompressed
+
+    if in_member:
+        return False, "truncated gzip member", uncompressed
+    if members == 0:
+        return False, "no gzip members", uncompressed
+    return True, None, uncompressed
+
+def verify_file(filename):
+    started = time.perf_counter()
+    ok, error, uncompressed = verify_gzip_stream(filename)
+    return filename, ok, error, uncompressed, time.perf_counter() - started
+
+def verify_files(filenames, workers=None):
+    workers = workers or os.cpu_count()
+    if workers <= 1:
+        yield from map(verify_file, filenames)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(verify_file, filenames, chunksize=4)